@@ -1,6 +1,7 @@
 from logging.config import fileConfig
 from toolmeta_harvester.db.models import Base
 from toolmeta_harvester.config import load_db_config
+from toolmeta_harvester.db.engine import engine_url
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
@@ -17,7 +18,8 @@ if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
 db = load_db_config()
-postgres_url = f"postgresql+psycopg://{db.user}:{db.password}@{db.host}/{db.name}"
+# % is an interpolation character in alembic's config
+postgres_url = engine_url(db).render_as_string(hide_password=False).replace("%", "%%")
 
 config.set_main_option(
     "sqlalchemy.url",
@@ -0,0 +1,36 @@
+"""tool harvest tree shas
+
+Revision ID: 3b7e9c2d4f16
+Revises: 8d41b6a0c3e2
+Create Date: 2026-10-17 16:41:07.218463
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e9c2d4f16'
+down_revision: Union[str, Sequence[str], None] = '8d41b6a0c3e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "_tool_harvest",
+        sa.Column("tree_sha", sa.String(), nullable=True)
+    )
+    op.add_column(
+        "_tool_harvest",
+        sa.Column("head_commit", sa.String(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("_tool_harvest", "head_commit")
+    op.drop_column("_tool_harvest", "tree_sha")
@@ -0,0 +1,46 @@
+"""unique tool harvest url per artifact type
+
+Revision ID: 5c2f8e1b9d47
+Revises: 1ae51acc54dc
+Create Date: 2026-10-17 10:12:44.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2f8e1b9d47'
+down_revision: Union[str, Sequence[str], None] = '1ae51acc54dc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Re-running the population step left duplicate rows, keep the oldest one
+    op.execute(
+        sa.text(
+            """
+            DELETE FROM _tool_harvest a
+            USING _tool_harvest b
+            WHERE a.url = b.url
+              AND a.artifact_type = b.artifact_type
+              AND a.id > b.id
+            """
+        )
+    )
+    op.create_unique_constraint(
+        "uq_tool_harvest_url_artifact_type",
+        "_tool_harvest",
+        ["url", "artifact_type"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint(
+        "uq_tool_harvest_url_artifact_type", "_tool_harvest", type_="unique"
+    )
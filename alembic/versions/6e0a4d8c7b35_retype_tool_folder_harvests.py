@@ -0,0 +1,60 @@
+"""retype tool folder harvests
+
+Revision ID: 6e0a4d8c7b35
+Revises: 3b7e9c2d4f16
+Create Date: 2026-10-17 19:12:44.906127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e0a4d8c7b35'
+down_revision: Union[str, Sequence[str], None] = '3b7e9c2d4f16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Tool folder urls are "{repository url without query}/{folder}?ref={branch}",
+# registered as galaxy_shed_tool rows before folders got their own type
+IS_FOLDER_OF_REPOSITORY = """
+    EXISTS (
+        SELECT 1 FROM _tool_harvest r
+        WHERE r.artifact_type = 'galaxy_shed_tool'
+          AND r.id <> f.id
+          AND f.url LIKE split_part(r.url, '?', 1) || '/%?ref=%'
+    )
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Folders already registered under the new type keep that row
+    op.execute(
+        "DELETE FROM _tool_harvest f"
+        " WHERE f.artifact_type = 'galaxy_shed_tool'"
+        f" AND {IS_FOLDER_OF_REPOSITORY}"
+        " AND EXISTS (SELECT 1 FROM _tool_harvest n"
+        " WHERE n.artifact_type = 'galaxy_shed_tool_folder' AND n.url = f.url)"
+    )
+    op.execute(
+        "UPDATE _tool_harvest f SET artifact_type = 'galaxy_shed_tool_folder'"
+        " WHERE f.artifact_type = 'galaxy_shed_tool'"
+        f" AND {IS_FOLDER_OF_REPOSITORY}"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Folders also registered under the old type keep that row
+    op.execute(
+        "DELETE FROM _tool_harvest f"
+        " WHERE f.artifact_type = 'galaxy_shed_tool_folder'"
+        " AND EXISTS (SELECT 1 FROM _tool_harvest o"
+        " WHERE o.artifact_type = 'galaxy_shed_tool' AND o.url = f.url)"
+    )
+    op.execute(
+        "UPDATE _tool_harvest SET artifact_type = 'galaxy_shed_tool'"
+        " WHERE artifact_type = 'galaxy_shed_tool_folder'"
+    )
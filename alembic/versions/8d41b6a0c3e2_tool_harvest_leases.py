@@ -0,0 +1,52 @@
+"""tool harvest leases
+
+Revision ID: 8d41b6a0c3e2
+Revises: 5c2f8e1b9d47
+Create Date: 2026-10-17 14:03:19.552081
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b6a0c3e2'
+down_revision: Union[str, Sequence[str], None] = '5c2f8e1b9d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "_tool_harvest",
+        sa.Column("lease_owner", sa.String(), nullable=True)
+    )
+    op.add_column(
+        "_tool_harvest",
+        sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.add_column(
+        "_tool_harvest",
+        sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.add_column(
+        "_tool_harvest",
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False)
+    )
+    op.create_index(
+        "ix_tool_harvest_claim",
+        "_tool_harvest",
+        ["artifact_type", "status"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_tool_harvest_claim", table_name="_tool_harvest")
+    op.drop_column("_tool_harvest", "attempts")
+    op.drop_column("_tool_harvest", "heartbeat_at")
+    op.drop_column("_tool_harvest", "lease_expires_at")
+    op.drop_column("_tool_harvest", "lease_owner")
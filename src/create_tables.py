@@ -1,5 +1,5 @@
 from sqlalchemy import text
-from toolmeta_harvester.db.engine import engine
+from toolmeta_harvester.db.engine import get_engine
 from toolmeta_harvester.db.models import (
     Base,
 )
@@ -7,6 +7,7 @@ from toolmeta_harvester.db.models import (
 def main():
     """Create all tables in the database."""
     try:
+        engine = get_engine()
         with engine.connect() as conn:
             result = conn.execute(text("SELECT 1"))
             print("Connection OK:", result.scalar())
@@ -0,0 +1,145 @@
+import json
+import logging
+import time
+import uuid
+from types import SimpleNamespace
+from sqlalchemy.exc import IntegrityError
+from toolmeta_models import (
+    ToolArtifact,
+    ToolContract,
+    ToolInput,
+    ToolImplementation,
+    ToolOutput,
+)
+from toolmeta_harvester.db.engine import new_session
+from toolmeta_harvester.tasks import galaxy_harvest_tasks as ght
+
+logger = logging.getLogger(__name__)
+
+# Run against a throwaway local database, the workflows are not removed
+NO_OF_WORKFLOWS = 50
+NO_OF_PARAMS = 200
+
+
+def make_workflow():
+    params = [
+        {"name": f"p{i}", "tag": "param", "type": "data", "format": "fastq,bam"}
+        for i in range(NO_OF_PARAMS)
+    ]
+    tool = SimpleNamespace(inputs=params, outputs=params)
+    return SimpleNamespace(
+        uuid=str(uuid.uuid4()),
+        name="bench",
+        version="1",
+        url="https://example.org/bench",
+        description="bench",
+        raw_ga={"format-version": "0.1"},
+        input_tools=[tool],
+    )
+
+
+# add_workflow_to_db as it was before the bulk path, kept verbatim: the ORM
+# adds every input and output and flushes once per workflow
+def legacy_add_workflow(wf, session):
+    try:
+        db_wf = ToolArtifact(
+            id=wf.uuid,
+            name=wf.name,
+            version=wf.version,
+            archetype="galaxy_workflow",
+            location=wf.url,
+            raw_metadata=json.dumps(wf.raw_ga),
+            metadata_type="a_galaxy_workflow",
+            metadata_version=wf.raw_ga.get("format-version", "unknown"),
+        )
+
+        session.add(db_wf)
+
+        db_contract = ToolContract(
+            description=wf.description,
+            contract_version="0.1",
+        )
+
+        session.add(db_contract)
+        session.flush()  # Ensure db_contract.id is populated
+
+        db_implementation = ToolImplementation(
+            contract_id=db_contract.id,
+            artifact_id=db_wf.id,
+        )
+
+        session.add(db_implementation)
+
+        for tool in wf.input_tools:
+            for input in tool.inputs:
+                logger.debug(f"Processing input: {input}")
+                input_kind = {"param": "parameter", "data": "data"}.get(
+                    input.get("tag", ""), ""
+                )
+                db_input = ToolInput(
+                    contract_id=db_contract.id,
+                    name=input.get("name", ""),
+                    role=input.get("tag", ""),
+                    input_kind=input_kind,
+                    type=input.get("type", ""),
+                    description=input.get("label", ""),
+                    encoding_formats=[],
+                )
+                formats = input.get("format").split(
+                    ",") if input.get("format") else []
+                for fmt in formats:
+                    db_input.encoding_formats.append(fmt.strip())
+                session.add(db_input)
+
+            for output in tool.outputs:
+                db_output = ToolOutput(
+                    contract_id=db_contract.id,
+                    name=output.get("name", ""),
+                    type=output.get("type", ""),
+                    description=output.get("label", ""),
+                    encoding_formats=[],
+                )
+                formats = (
+                    output.get("format").split(
+                        ",") if output.get("format") else []
+                )
+                for fmt in formats:
+                    db_output.encoding_formats.append(fmt.strip())
+
+                session.add(db_output)
+
+        session.flush()
+        logger.info(
+            f"Adding workflow: {db_wf.id}, {
+                db_wf.name}, version: {db_wf.version}"
+        )
+
+        session.commit()
+        session.flush()
+    except IntegrityError as e:
+        logger.error(f"IntegrityError for workflow tool {db_wf.id}: {e}")
+        session.rollback()
+
+
+def main():
+    ght.create_tables()
+    with new_session() as session:
+        wfs = [make_workflow() for _ in range(NO_OF_WORKFLOWS)]
+        start = time.perf_counter()
+        for wf in wfs:
+            legacy_add_workflow(wf, session)
+        legacy_time = time.perf_counter() - start
+
+        wfs = [make_workflow() for _ in range(NO_OF_WORKFLOWS)]
+        start = time.perf_counter()
+        ght.add_workflows_to_db(wfs, session)
+        bulk_time = time.perf_counter() - start
+
+    logger.info(f"ORM, baseline: {legacy_time:.2f}s for {NO_OF_WORKFLOWS} workflows")
+    logger.info(f"Bulk: {bulk_time:.2f}s for {NO_OF_WORKFLOWS} workflows")
+    logger.info(f"Speedup: {legacy_time / bulk_time:.1f}x")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,109 @@
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+MODULES = [
+    "toolmeta_harvester.config",
+    "toolmeta_harvester.db.engine",
+    "toolmeta_harvester.adaptors.http_client",
+    "toolmeta_harvester.adaptors.galaxy_toolshed",
+    "toolmeta_harvester.adaptors.galaxy_workflow",
+    "toolmeta_harvester.adaptors.galaxy_workflow_hub",
+    "toolmeta_harvester.adaptors.galaxy_client",
+    "toolmeta_harvester.tasks.galaxy_harvest_tasks",
+    "toolmeta_harvester.tasks.workflow_hub_pipeline",
+    "toolmeta_harvester.tasks.harvest_queue",
+    "toolmeta_harvester.flows.harvest_galaxy_hub_workflows",
+    "toolmeta_harvester.flows.harvest_toolshed_worker",
+    "toolmeta_harvester.flows.harvest_vip_apps",
+    "toolmeta_harvester.flows.harvest_example_flow",
+    "toolmeta_harvester.flows.toolshed_blob_gc",
+]
+# Third party packages every module pays for, measured on their own
+BASELINE = ["requests", "lxml.etree", "yaml", "sqlalchemy"]
+REPEAT = 5
+
+# Fails when importing the module installed a global requests cache or
+# loaded the settings
+CHECK_SIDE_EFFECTS = """
+import importlib, sys, requests
+original = requests.Session
+importlib.import_module(sys.argv[1])
+assert requests.Session is original, "global requests cache installed"
+config = sys.modules.get("toolmeta_harvester.config")
+assert not config or not config.get_settings.cache_info().currsize, "settings loaded"
+assert "dynaconf" not in sys.modules, "dynaconf imported"
+"""
+
+
+# Cumulative import time in ms of module in a fresh interpreter
+def import_time(module, cwd):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    lines = result.stderr.splitlines()
+    if result.returncode:
+        errors = [line for line in lines if not line.startswith("import time:")]
+        raise RuntimeError(errors[-1] if errors else "import failed")
+    for line in reversed(lines):
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def side_effects(module, cwd):
+    result = subprocess.run(
+        [sys.executable, "-c", CHECK_SIDE_EFFECTS, module],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    problems = []
+    if result.returncode:
+        problems.append(result.stderr.strip().splitlines()[-1])
+    created = os.listdir(cwd)
+    if created:
+        problems.append(f"created {', '.join(sorted(created))}")
+    return problems
+
+
+def main():
+    baseline = {}
+    with tempfile.TemporaryDirectory() as cwd:
+        for module in BASELINE:
+            baseline[module] = min(import_time(module, cwd) for _ in range(REPEAT))
+            logger.info(f"{module:55s} {baseline[module]:8.1f} ms")
+    logger.info("-" * 66)
+    failed = 0
+    for module in MODULES:
+        # Every import runs in an empty directory so created files show up
+        with tempfile.TemporaryDirectory() as cwd:
+            try:
+                elapsed = min(import_time(module, cwd) for _ in range(REPEAT))
+            except RuntimeError as e:
+                # A broken import would otherwise pass the side effect check
+                failed += 1
+                logger.error(f"{module:55s} IMPORT FAILED: {e}")
+                continue
+            problems = side_effects(module, cwd)
+        if problems:
+            failed += 1
+        logger.info(
+            f"{module:55s} {elapsed:8.1f} ms"
+            + (f"  SIDE EFFECTS: {'; '.join(problems)}" if problems else "")
+        )
+    logger.info(f"Modules failing to import or with import side effects: {failed}")
+    return failed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    sys.exit(1 if main() else 0)
@@ -0,0 +1,77 @@
+import logging
+import timeit
+from lxml import etree
+from lxml.etree import XMLSyntaxError
+from toolmeta_harvester.adaptors import galaxy_toolshed as shed
+
+logger = logging.getLogger(__name__)
+
+NO_OF_TOKENS = 60
+NO_OF_PARAMS = 200
+HELP_LINES = 2000
+REPEAT = 20
+
+
+def build_tool_xml():
+    tokens = "\n".join(
+        f'<token name="@TOKEN_{i}@">value_{i} @TOKEN_{i + 1}@</token>'
+        for i in range(NO_OF_TOKENS - 1)
+    )
+    tokens += f'\n<token name="@TOKEN_{NO_OF_TOKENS - 1}@">last</token>'
+    params = "\n".join(
+        f'<param name="p{i}" type="data" format="@TOKEN_{i % NO_OF_TOKENS}@" '
+        f'label="Param {i} @TOKEN_0@"/>'
+        for i in range(NO_OF_PARAMS)
+    )
+    help_text = "\n".join(
+        f"Line {i} of the help text mentions @TOKEN_{i % NO_OF_TOKENS}@"
+        for i in range(HELP_LINES)
+    )
+    return f"""<tool id="bench" name="bench" version="@TOKEN_0@">
+<macros>{tokens}</macros>
+<inputs>{params}</inputs>
+<help>{help_text}</help>
+</tool>"""
+
+
+# The fixed point loop parse_xml used before TokenEngine
+def legacy_expand(tool_xml, tokens):
+    new_xml = tool_xml
+    tmp_xml = None
+    while tmp_xml != new_xml:
+        tmp_xml = new_xml
+        new_xml = shed.substitute_tokens(new_xml, tokens)
+        try:
+            etree.fromstring(new_xml.encode())
+        except XMLSyntaxError:
+            new_xml = tmp_xml
+            break
+    return etree.fromstring(new_xml.encode())
+
+
+def engine_expand(tool_xml, tokens):
+    shed.TOKEN_ENGINES.clear()
+    tree = etree.fromstring(tool_xml.encode())
+    return shed.expand_tokens(tool_xml, tree, tokens)
+
+
+def main():
+    tool_xml = build_tool_xml()
+    tokens = shed.extract_tokens(etree.fromstring(tool_xml.encode()))
+
+    legacy = etree.tostring(legacy_expand(tool_xml, tokens))
+    engine = etree.tostring(engine_expand(tool_xml, tokens))
+    if legacy != engine:
+        logger.error("Token engine output differs from the legacy loop")
+
+    legacy_time = timeit.timeit(lambda: legacy_expand(tool_xml, tokens), number=REPEAT)
+    engine_time = timeit.timeit(lambda: engine_expand(tool_xml, tokens), number=REPEAT)
+    logger.info(f"Tool XML size: {len(tool_xml)} bytes, tokens: {len(tokens)}")
+    logger.info(f"Legacy loop: {legacy_time / REPEAT * 1000:.2f} ms per tool")
+    logger.info(f"Token engine: {engine_time / REPEAT * 1000:.2f} ms per tool")
+    logger.info(f"Speedup: {legacy_time / engine_time:.1f}x")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
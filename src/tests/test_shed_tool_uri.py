@@ -0,0 +1,43 @@
+import logging
+from toolmeta_harvester.adaptors import galaxy_toolshed as shed
+
+logger = logging.getLogger(__name__)
+
+SHED_YML = {"owner": "devteam", "name": "bwa"}
+
+
+# Harvested tools must carry the uri workflows reference them by
+def test_shed_tool_uri_round_trip():
+    uri = shed.shed_tool_uri(SHED_YML, "bwa_mem", "0.7.17.2")
+    assert uri == "toolshed.g2.bx.psu.edu/repos/devteam/bwa/bwa_mem/0.7.17.2"
+    assert shed.get_shed_uri_parts(uri) == (
+        "toolshed.g2.bx.psu.edu",
+        "devteam",
+        "bwa",
+        "bwa_mem",
+        "0.7.17.2",
+    )
+
+
+def test_shed_tool_uri_default_version():
+    uri = shed.shed_tool_uri(SHED_YML, "bwa_mem", None)
+    assert shed.get_shed_uri_parts(uri)[-1] == "1.0.0"
+
+
+def test_shed_tool_uri_missing_parts():
+    assert shed.shed_tool_uri(SHED_YML, None, "1") is None
+    assert shed.shed_tool_uri({"owner": "devteam"}, "bwa_mem", "1") is None
+    assert shed.shed_tool_uri(None, "bwa_mem", "1") is None
+
+
+def main():
+    tests = [test_shed_tool_uri_round_trip, test_shed_tool_uri_default_version,
+             test_shed_tool_uri_missing_parts]
+    for test in tests:
+        test()
+        logger.info(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+# Git object id of a file: sha1 over a "blob <size>\0" header and the bytes
+def git_blob_sha(data):
+    header = f"blob {len(data)}\0".encode()
+    return hashlib.sha1(header + data).hexdigest()
+
+
+class BlobStore:
+    """
+    Content addressed store of git blobs: blob sha -> zlib compressed bytes.
+    A blob never changes under its sha, so a file listed with the same sha in
+    another run, branch or fork is read from here instead of downloaded.
+    Next to the blobs the store keeps, per tool folder, the shas of its last
+    listing. prune_refs() forgets the folders a repository no longer has and
+    gc() drops the blobs no folder lists any more.
+    """
+
+    def __init__(self, path, level=6):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.level = level
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS refs (
+                folder_url TEXT NOT NULL,
+                sha TEXT NOT NULL,
+                PRIMARY KEY (folder_url, sha)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_refs_sha ON refs (sha)")
+        self._conn.commit()
+
+    def get(self, sha):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM blobs WHERE sha = ?", (sha,)
+            ).fetchone()
+        return zlib.decompress(row[0]) if row else None
+
+    def put(self, sha, data):
+        """
+        Store data under sha. Data that does not hash to sha, e.g. a proxy
+        error page, is not stored. Returns whether the blob was stored.
+        """
+        if git_blob_sha(data) != sha:
+            logger.debug(f"Blob {sha} does not match its content, not stored")
+            return False
+        compressed = zlib.compress(data, self.level)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO blobs (sha, data, size, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (sha, compressed, len(data), time.time()),
+            )
+            self._conn.commit()
+        return True
+
+    # fetch is called without the lock held, two threads missing the same
+    # blob may both download it
+    def get_or_fetch(self, sha, fetch):
+        data = self.get(sha)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if data is None:
+            data = fetch()
+            self.put(sha, data)
+        return data
+
+    def set_refs(self, folder_url, shas):
+        """Replace the shas listed in folder_url by its current listing"""
+        with self._lock:
+            self._conn.execute("DELETE FROM refs WHERE folder_url = ?", (folder_url,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO refs (folder_url, sha) VALUES (?, ?)",
+                [(folder_url, sha) for sha in shas if sha],
+            )
+            self._conn.commit()
+
+    def prune_refs(self, prefix, folder_urls):
+        """
+        Delete the refs of the folders under prefix that are not in
+        folder_urls. Returns the number of folders dropped.
+        """
+        folder_urls = set(folder_urls)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT folder_url FROM refs"
+                " WHERE substr(folder_url, 1, ?) = ?",
+                (len(prefix), prefix),
+            ).fetchall()
+            stale = [(url,) for (url,) in rows if url not in folder_urls]
+            self._conn.executemany("DELETE FROM refs WHERE folder_url = ?", stale)
+            self._conn.commit()
+        return len(stale)
+
+    def gc(self, vacuum=False):
+        """
+        Delete the blobs no tool folder lists any more. Returns the number of
+        blobs deleted and their compressed size in bytes.
+        """
+        with self._lock:
+            removed, freed = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM blobs"
+                " WHERE sha NOT IN (SELECT sha FROM refs)"
+            ).fetchone()
+            self._conn.execute(
+                "DELETE FROM blobs WHERE sha NOT IN (SELECT sha FROM refs)"
+            )
+            self._conn.commit()
+            if vacuum:
+                self._conn.execute("VACUUM")
+        return removed, freed
+
+    def stats(self):
+        with self._lock:
+            blobs, size, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0),"
+                " COALESCE(SUM(LENGTH(data)), 0) FROM blobs"
+            ).fetchone()
+            folders = self._conn.execute(
+                "SELECT COUNT(DISTINCT folder_url) FROM refs"
+            ).fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "path": str(self.path),
+                "blobs": blobs,
+                "folders": folders,
+                "size_bytes": size,
+                "stored_bytes": stored,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,109 @@
+import functools
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def lazy(factory):
+    """
+    Decorator turning a zero argument factory into an accessor that builds
+    the value on first call, once, even when called from several threads.
+    accessor.reset() drops the value so the next call builds a new one.
+    """
+    lock = threading.Lock()
+    value = _MISSING
+
+    @functools.wraps(factory)
+    def accessor():
+        nonlocal value
+        if value is _MISSING:
+            with lock:
+                if value is _MISSING:
+                    value = factory()
+        return value
+
+    def reset():
+        nonlocal value
+        with lock:
+            value = _MISSING
+
+    accessor.reset = reset
+    return accessor
+
+
+class LRUCache:
+    """
+    Thread safe, size bounded mapping evicting the least recently used entry.
+    None is a valid cached value, use `key in cache` or get(key, default) to
+    tell it apart from a miss.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    # Load a missing key once, concurrent callers wait for the first loader
+    def get_or_load(self, key, loader):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                with self._lock:
+                    value = self._data.get(key, _MISSING)
+                if value is _MISSING:
+                    value = loader()
+                    self.put(key, value)
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
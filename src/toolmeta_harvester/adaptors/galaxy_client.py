@@ -1,40 +1,58 @@
-from bioblend.galaxy import GalaxyInstance
+import logging
 from toolmeta_harvester.config import load_galaxy_config
 from toolmeta_harvester.adaptors import galaxy_workflow as hub
 
-GALAXY_CONFIG = load_galaxy_config()
-GALAXY_URL = GALAXY_CONFIG.host_url
-API_KEY = GALAXY_CONFIG.api_key
-
-gi = GalaxyInstance(url=GALAXY_URL, key=API_KEY)
-
-# Test the connection
-print(f"Connected to {GALAXY_URL}, version: {gi.config.get_version()}")
-
-# workflows = hub.get_hub_workflows(type="galaxy")
-# for w in workflows:
-#     ga_w = hub.get_ga_workflow(w)
-#     # workflow = gi.workflows.import_workflow_dict(ga_w)
-#     shed_tools = hub.get_step_shed_tools(ga_w)
-#     print(shed_tools)
-#     # workflow_id = workflow["id"]
-#     # tools = gi.workflows.show_workflow(workflow_id)["steps"]
-#     # for step_id, step in tools.items():
-#     #     tool_id = step["tool_id"]
-#     #
-#     #     # Get resolved IO for that tool
-#     #     tool_info = gi.tools.show_tool(tool_id, io_details=True)
-#     #     print(tool_info)
-#     #
-#         # print(tool_id, tool_info["inputs"], tool_info["outputs"])
-#     break
+logger = logging.getLogger(__name__)
+
+
+class GalaxyClient:
+    """
+    Connection to a Galaxy server through bioblend. The server is only
+    contacted, and bioblend only imported, on first use.
+    """
+
+    def __init__(self, url, api_key):
+        self.url = url
+        self.api_key = api_key
+        self._gi = None
+
+    @classmethod
+    def from_config(cls):
+        config = load_galaxy_config()
+        return cls(config.host_url, config.api_key)
+
+    @property
+    def gi(self):
+        if self._gi is None:
+            from bioblend.galaxy import GalaxyInstance
+
+            self._gi = GalaxyInstance(url=self.url, key=self.api_key)
+        return self._gi
+
+    def version(self):
+        return self.gi.config.get_version()
+
+    def workflows(self):
+        return self.gi.workflows.get_workflows()
+
+    def workflow_steps(self, workflow_id):
+        return self.gi.workflows.show_workflow(workflow_id)["steps"]
+
+    # Data inputs and outputs of a tool as resolved by the server
+    def tool_io(self, tool_id):
+        tool_info = self.gi.tools.show_tool(tool_id, io_details=True)
+        return (
+            extract_data_inputs(tool_info["inputs"]),
+            extract_outputs(tool_info["outputs"]),
+        )
+
 
 def extract_data_inputs(tool_inputs):
     data_inputs = []
 
     def recurse(inputs):
         for inp in inputs:
-            print(inp)
+            logger.debug(inp)
             if inp["type"] in ("data", "data_collection"):
                 data_inputs.append({
                     "name": inp["name"],
@@ -68,29 +86,53 @@ def extract_outputs(tool_outputs):
 
     return outputs
 
-workflows = gi.workflows.get_workflows()
-for w in workflows:
-    print(w["id"])
-    workflow_id = w['id']
-    tools = gi.workflows.show_workflow(workflow_id)["steps"]
-    tool_info = gi.tools.show_tool("fastp", io_details=True)
-    tool_inputs = extract_data_inputs(tool_info["inputs"])
-    tool_outputs = extract_outputs(tool_info["outputs"])
+
+def main():
+    client = GalaxyClient.from_config()
+    # Test the connection
+    print(f"Connected to {client.url}, version: {client.version()}")
+
+    # workflows = hub.get_hub_workflows(type="galaxy")
+    # for w in workflows:
+    #     ga_w = hub.get_ga_workflow(w)
+    #     # workflow = gi.workflows.import_workflow_dict(ga_w)
+    #     shed_tools = hub.get_step_shed_tools(ga_w)
+    #     print(shed_tools)
+    #     # workflow_id = workflow["id"]
+    #     # tools = gi.workflows.show_workflow(workflow_id)["steps"]
+    #     # for step_id, step in tools.items():
+    #     #     tool_id = step["tool_id"]
+    #     #
+    #     #     # Get resolved IO for that tool
+    #     #     tool_info = gi.tools.show_tool(tool_id, io_details=True)
+    #     #     print(tool_info)
+    #     #
+    #         # print(tool_id, tool_info["inputs"], tool_info["outputs"])
+    #     break
+
+    workflows = client.workflows()
+    for w in workflows:
+        print(w["id"])
+        workflow_id = w['id']
+        tools = client.workflow_steps(workflow_id)
+        tool_inputs, tool_outputs = client.tool_io("fastp")
     
-    # print(tool_inputs)
-    # print()
-    # print(tool_outputs)
-    # print(tool_info)
-    # print(tool_info["inputs"], tool_info["outputs"])
-    # for step_id, step in tools.items():
-    #     tool_id = step["tool_id"]
-    #   
-    #     # tool_info = gi.tools.show_tool(tool_id, io_details=True)
-    #     tool_info = gi.tools.show_tool(tool_id)
-    #     print(tool_info)
-    #     print("########################################################")
-    #     print()
+        # print(tool_inputs)
+        # print()
+        # print(tool_outputs)
+        # print(tool_info)
+        # print(tool_info["inputs"], tool_info["outputs"])
+        # for step_id, step in tools.items():
+        #     tool_id = step["tool_id"]
+        #   
+        #     # tool_info = gi.tools.show_tool(tool_id, io_details=True)
+        #     tool_info = gi.tools.show_tool(tool_id)
+        #     print(tool_info)
+        #     print("########################################################")
+        #     print()
       
-        # print(tool_id, tool_info["inputs"], tool_info["outputs"])
+            # print(tool_id, tool_info["inputs"], tool_info["outputs"])
 
 
+if __name__ == "__main__":
+    main()
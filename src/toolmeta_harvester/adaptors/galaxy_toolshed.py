@@ -1,16 +1,24 @@
 import logging
-import requests
-import requests_cache
+import multiprocessing
+import os
+import re
+import tarfile
+import tempfile
+import threading
+import time
 import json
 import yaml
-from time import sleep
 from urllib.parse import urljoin
 from dataclasses import dataclass
 from pathlib import Path
 from lxml import etree
 from lxml.etree import XMLSyntaxError
-from urllib.parse import urlparse
-from toolmeta_harvester.config import load_git_config
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from toolmeta_harvester.adaptors import http_client
+from toolmeta_harvester.adaptors.caching import LRUCache, lazy
+from toolmeta_harvester.adaptors.tool_index import ToolIndex
+from toolmeta_harvester.adaptors.tool_cache import MISSING, ToolInfoCache
 
 logger = logging.getLogger(__name__)
 
@@ -19,18 +27,20 @@ CACHE_FILE = "cache/toolshed_registry.json"
 
 galaxy_shed_ignore_list = ["kubernetes"]
 
-GIT_CONFIG = load_git_config()
-GITHUB_TOKEN = GIT_CONFIG.api_key
-
+# The Authorization header is added by http_client from the GitHub token pool
 HEADERS = {
-    "Authorization": f"Bearer {GITHUB_TOKEN}",
     "Accept": "application/vnd.github+json",
 }
 
-# Initialize requests cache
-requests_cache.install_cache(
-    "cache/toolshed_cache", backend="sqlite", expire_after=86400
-)
+
+# Cache for the Toolshed API, see [http_cache.toolshed]. GitHub requests go
+# through http_client, which revalidates them with ETags instead of expiring
+# them.
+@lazy
+def shed_api_session():
+    from toolmeta_harvester.adaptors.http_cache import cached_session
+
+    return cached_session("toolshed")
 
 
 # @dataclass(frozen=True)
@@ -51,7 +61,7 @@ class ToolInfo:
 
 
 def get_json(url):
-    r = requests.get(url, timeout=30, headers=HEADERS)
+    r = http_client.get(url, timeout=30, headers=HEADERS)
     r.raise_for_status()
     return r.json()
 
@@ -78,11 +88,39 @@ def fetch_xml(url):
 
 
 def fetch_text_file(url):
-    r = requests.get(url, timeout=30, headers=HEADERS)
+    r = http_client.get(url, timeout=30, headers=HEADERS)
     r.raise_for_status()
     return r.text
 
 
+def fetch_bytes(url):
+    r = http_client.get(url, timeout=30, headers=HEADERS)
+    r.raise_for_status()
+    return r.content
+
+
+# Files by git blob sha, see [crawl] blob_store. None when disabled.
+@lazy
+def blob_store():
+    path = http_client.crawl_config().blob_store
+    if not path:
+        return None
+    from toolmeta_harvester.adaptors.blob_store import BlobStore
+
+    return BlobStore(path)
+
+
+# Text of a file entry of a GitHub contents listing. The listing carries the
+# blob sha, so a file already in the blob store is not downloaded again.
+def fetch_entry_text(entry):
+    store = blob_store()
+    sha = entry.get("sha")
+    if store is None or not sha:
+        return fetch_text_file(entry["download_url"])
+    data = store.get_or_fetch(sha, lambda: fetch_bytes(entry["download_url"]))
+    return data.decode("utf-8", errors="replace")
+
+
 def get_macro_files(tree):
     return [macros.text.strip() for macros in tree.xpath("//macros/import")]
 
@@ -99,12 +137,86 @@ def extract_tokens(tree):
 def substitute_tokens(xml_str, tokens):
     for k, v in tokens.items():
         # if "VERSION" in k or "PREFIX" in k:
-        xml_str = xml_str.replace(k, v)
+        xml_str = xml_str.replace(k, v or "")
     return xml_str
 
 
+class TokenEngine:
+    """
+    Single pass token substitution. Nested tokens are resolved in the token
+    values up front, the document is then rewritten with one regex pass over
+    all token names (longest name first).
+    """
+
+    def __init__(self, tokens):
+        self.tokens = {k: v or "" for k, v in tokens.items() if k}
+        names = sorted(self.tokens, key=len, reverse=True)
+        self.pattern = re.compile("|".join(map(re.escape, names))) if names else None
+        self.resolved = {}
+        for name in names:
+            self._resolve(name, set())
+
+    def _resolve(self, name, stack):
+        if name in self.resolved:
+            return self.resolved[name]
+        if name in stack:
+            # Cyclic definition, keep the raw value
+            return self.tokens[name]
+        stack.add(name)
+        value = self.pattern.sub(
+            lambda m: self._resolve(m.group(0), stack), self.tokens[name]
+        )
+        stack.discard(name)
+        self.resolved[name] = value
+        return value
+
+    def substitute(self, xml_str, nested=True):
+        if not self.pattern:
+            return xml_str
+        values = self.resolved if nested else self.tokens
+        return self.pattern.sub(lambda m: values[m.group(0)], xml_str)
+
+
+# Engines for the token sets of recently parsed tools, tools of one folder
+# usually share the tokens of their macro files
+TOKEN_ENGINES = LRUCache(maxsize=64)
+
+
+def get_token_engine(tokens):
+    key = tuple(tokens.items())
+    return TOKEN_ENGINES.get_or_load(key, lambda: TokenEngine(tokens))
+
+
+# Expand tokens and return the parsed tree. Expansion can break the XML
+# structure; then only the top level tokens are expanded, and if that is
+# still invalid the original tree is kept.
+def expand_tokens(tool_xml, tree, tokens):
+    engine = get_token_engine(tokens)
+    for nested in (True, False):
+        new_xml = engine.substitute(tool_xml, nested=nested)
+        if new_xml == tool_xml:
+            return tree
+        try:
+            return etree.fromstring(new_xml.encode())
+        except XMLSyntaxError:
+            logger.debug("Substituted XML is invalid, reducing token substitution.")
+    return tree
+
+
+# Same form as Galaxy tool ids, see get_shed_uri_parts
 def generate_tool_uri(name, owner, repo, version):
-    return f"toolshed.g2.bx.psu.edu/{owner}/{repo}/{name}/{version}"
+    return f"toolshed.g2.bx.psu.edu/repos/{owner}/{repo}/{name}/{version}"
+
+
+# Toolshed uri of a crawled tool from the owner and repository name in its
+# .shed.yml. None when one of them or the tool id is missing.
+def shed_tool_uri(shed_yml, tool_id, version):
+    owner = (shed_yml or {}).get("owner")
+    repo = (shed_yml or {}).get("name")
+    if not tool_id or not owner or not repo:
+        return None
+    # Galaxy's default when a tool declares no version
+    return generate_tool_uri(tool_id, owner, repo, version or "1.0.0")
 
 
 def extract_formats_from_tool(tool):
@@ -116,58 +228,126 @@ def extract_formats_from_tool(tool):
     return list(result)
 
 
-def parse_xml(tool_xml, dir_contents=None, repo_url=""):
+class MacroFile:
+    """
+    Imported macro file. The tree and tokens are parsed on first use, so
+    macro files that are only shipped to parser processes are not parsed in
+    the crawling process.
+    """
+
+    def __init__(self, key, xml, source):
+        self.key = key
+        self.xml = xml
+        self.source = source
+        self._parsed = None
+        self._lock = threading.Lock()
+
+    def _parse(self):
+        with self._lock:
+            if self._parsed is None:
+                try:
+                    tree = etree.fromstring(self.xml.encode())
+                    self._parsed = (tree, extract_tokens(tree))
+                except XMLSyntaxError as e:
+                    logger.error(f"Error parsing macro file {self.source}: {e}")
+                    self._parsed = (None, {})
+            return self._parsed
+
+    @property
+    def tree(self):
+        return self._parse()[0]
+
+    @property
+    def tokens(self):
+        return self._parse()[1]
+
+
+# Macro files shared by all tools of a folder/repository, keyed by download
+# url and blob sha (or local path and mtime for archives)
+@lazy
+def macro_cache():
+    return LRUCache(maxsize=http_client.crawl_config().macro_cache_size)
+
+
+def fetch_remote_macro(key, entry, macro_file):
+    macro_url = entry["download_url"]
+    macro_xml = fetch_entry_text(entry)
+    # Some macro.xml files are symlinks, GitHub serves the relative target path
+    if macro_xml.startswith("../"):
+        logger.debug(f"Retrying macro file with relative path: {macro_file}")
+        macro_url = urljoin(macro_url, macro_xml)
+        macro_xml = fetch_xml(macro_url)
+    return MacroFile(key, macro_xml, macro_url)
+
+
+# Fetch an imported macro file listed in a GitHub contents listing
+def load_remote_macro(dir_contents, macro_file):
+    entry = get_file_entry(dir_contents or [], macro_file)
+    if not entry:
+        return None
+    key = ("url", entry["download_url"], entry.get("sha"))
+    return macro_cache().get_or_load(
+        key, lambda: fetch_remote_macro(key, entry, macro_file)
+    )
+
+
+def remote_macro_loader(dir_contents):
+    def macro_loader(macro_file):
+        return load_remote_macro(dir_contents, macro_file)
+
+    return macro_loader
+
+
+def parse_tool_tree(tool_xml):
     try:
         tree = etree.fromstring(tool_xml.encode())
     except XMLSyntaxError:
         # This captures errors wher the XML file contains a reference to
         # a macro file e.g. ../macro.xml. The file itself is not XML
         return None
-
     if tree.tag != "tool":
         return None
-    macro_files = get_macro_files(tree)
-    new_xml = tool_xml
-    tokens = {}
-    for macro_file in macro_files:
+    return tree
+
+
+def load_macros(tree, macro_loader):
+    macros = []
+    for macro_file in get_macro_files(tree):
         logger.debug(f"Processing macro file: {macro_file}")
-        macro_url = get_file_url(dir_contents or [], macro_file)
-        if not macro_url:
-            continue
-        macro_xml = fetch_xml(macro_url)
-        try:
-            macro_tree = etree.fromstring(macro_xml.encode())
-        except XMLSyntaxError as e:
-            # Some macro.xml files use relative paths
-            if macro_xml.startswith("../"):
-                logger.debug(f"Retrying macro file with relative path: {macro_file}")
-                macro_url = urljoin(macro_url, macro_xml)
-                macro_xml = fetch_xml(macro_url)
-                macro_tree = etree.fromstring(macro_xml.encode())
-            else:
-                logger.error(
-                    f"Error parsing macro file {macro_file} from {macro_url}: {e}"
-                )
-                continue
-        tokens.update(extract_tokens(macro_tree))
+        macro = macro_loader(macro_file)
+        if macro is not None:
+            macros.append(macro)
+    return macros
 
-    # Tokens can be defined in the main tool XML as well
-    tokens.update(extract_tokens(tree))
-    # Substitute tokens until no changes
-    # Expanding the tokens can break the XML structure, so we need to do it iteratively
-    tmp_xml = None
-    while tmp_xml != new_xml:
-        tmp_xml = new_xml
-        new_xml = substitute_tokens(new_xml, tokens)
-        # Test if the new XML is valid
-        try:
-            etree.fromstring(new_xml.encode())
-        except XMLSyntaxError:
-            logger.debug("Substituted XML is invalid, stopping token substitution.")
-            new_xml = tmp_xml
-            break
 
-    tree = etree.fromstring(new_xml.encode())
+def parse_xml(
+    tool_xml, dir_contents=None, repo_url="", shed_yml=None, macro_loader=None
+):
+    """
+    Parse a Galaxy tool XML into a ToolInfo.
+    macro_loader(macro_file) returns the MacroFile of an import or None; by
+    default macros are fetched through dir_contents. shed_yml is fetched
+    from repo_url when not given.
+    """
+    tree = parse_tool_tree(tool_xml)
+    if tree is None:
+        return None
+    if macro_loader is None:
+        macro_loader = remote_macro_loader(dir_contents)
+    tokens = {}
+    for macro in load_macros(tree, macro_loader):
+        tokens.update(macro.tokens)
+    if shed_yml is None:
+        shed_yml = (
+            get_folder_context(repo_url, dir_contents).shed_yml if repo_url else {}
+        )
+    return tool_info_from_tree(tool_xml, tree, tokens, shed_yml, repo_url)
+
+
+def tool_info_from_tree(tool_xml, tree, tokens, shed_yml, repo_url):
+    # Tokens can be defined in the main tool XML as well
+    tokens = {**tokens, **extract_tokens(tree)}
+    tree = expand_tokens(tool_xml, tree, tokens)
     inputs = []
     outputs = []
     for param in tree.xpath(".//inputs//*"):
@@ -201,7 +381,6 @@ def parse_xml(tool_xml, dir_contents=None, repo_url=""):
     tool_id = tree.get("id")
     version = tree.get("version")
     # command = tree.findtext("command")
-    shed_yml = get_shed_yml(repo_url)
     description = (
         tree.findtext("description")
         or shed_yml.get("long_description")
@@ -215,8 +394,8 @@ def parse_xml(tool_xml, dir_contents=None, repo_url=""):
 
     return ToolInfo(
         id=tool_id,
-        # Polulate the uri later
-        uri=None,
+        # fetch_toolshed_tool replaces it with the uri the tool was asked for
+        uri=shed_tool_uri(shed_yml, tool_id, version),
         tool_name=tool_name,
         version=version,
         description=description,
@@ -228,6 +407,93 @@ def parse_xml(tool_xml, dir_contents=None, repo_url=""):
         repo_url=repo_url,
     )
 
+
+# Parsing stage. The crawl threads fetch a tool XML and its macro files into
+# a ParseJob; the CPU bound part runs in a process pool of
+# crawl.parse_workers processes, or inline when parse_workers is 0.
+@dataclass(frozen=True)
+class ParseJob:
+    tool_xml: str
+    # (key, xml, source) of the imported macro files
+    macros: tuple
+    shed_yml: dict
+    repo_url: str
+
+
+def make_parse_job(tool_xml, macro_loader, shed_yml, repo_url):
+    tree = parse_tool_tree(tool_xml)
+    if tree is None:
+        return None
+    macros = tuple(
+        (m.key, m.xml, m.source) for m in load_macros(tree, macro_loader)
+    )
+    return ParseJob(tool_xml, macros, shed_yml, repo_url)
+
+
+def build_tool_info(job):
+    tree = parse_tool_tree(job.tool_xml)
+    if tree is None:
+        return None
+    tokens = {}
+    for key, xml, source in job.macros:
+        macro = parse_macro_cache().get_or_load(
+            key, lambda: MacroFile(key, xml, source)
+        )
+        tokens.update(macro.tokens)
+    return tool_info_from_tree(
+        job.tool_xml, tree, tokens, job.shed_yml, job.repo_url
+    )
+
+
+_parser_pool = None
+_parser_pool_lock = threading.Lock()
+# Macro cache of a parser process, set by init_parse_worker
+_worker_macro_cache = None
+
+
+# Runs in every parser process. The cache size is passed in so the worker
+# never builds an HttpClient (settings, token pool, sessions) to read it.
+def init_parse_worker(macro_cache_size):
+    global _worker_macro_cache
+    _worker_macro_cache = LRUCache(maxsize=macro_cache_size)
+
+
+# The parser process' own cache, or macro_cache() when parsing in the crawl
+# threads
+def parse_macro_cache():
+    if _worker_macro_cache is not None:
+        return _worker_macro_cache
+    return macro_cache()
+
+
+def get_parser_pool():
+    global _parser_pool
+    config = http_client.crawl_config()
+    if config.parse_workers <= 0:
+        return None
+    with _parser_pool_lock:
+        if _parser_pool is None:
+            # spawn: the crawling process runs threads, forking it is unsafe
+            _parser_pool = ProcessPoolExecutor(
+                max_workers=config.parse_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_parse_worker,
+                initargs=(config.macro_cache_size,),
+            )
+    return _parser_pool
+
+
+# Returns one result per job, None for jobs that are None or not a tool
+def parse_jobs(jobs):
+    jobs = list(jobs)
+    valid = [job for job in jobs if job]
+    pool = get_parser_pool()
+    if pool is None or len(valid) <= 1:
+        results = iter([build_tool_info(job) for job in valid])
+    else:
+        results = iter(pool.map(build_tool_info, valid))
+    return [next(results) if job else None for job in jobs]
+
 def get_shed_uri_parts(tool_uri: str):
     """
     Extract ToolShed URI parts from Galaxy tool_id.
@@ -276,13 +542,79 @@ def fetch_tool_meta_from_shed_api(tool_uri: str) -> dict:
 
     url = f"https://{host}/api/tools/{owner}~{repo}~{name}/versions/{revision}"
 
-    r = requests.get(url, timeout=120)
+    r = shed_api_session().get(url, timeout=120)
     r.raise_for_status()
     return r.json()
 
+@lazy
+def tool_index():
+    return ToolIndex(http_client.crawl_config().tool_index)
+
+
+# Record the tools parsed from a folder in tool_index(). tools is a list of
+# (xml file name, ToolInfo or None).
+def index_folder_tools(folder_url, shed_yml, tools):
+    owner = shed_yml.get("owner", "")
+    repo = shed_yml.get("name") or folder_url.split("?")[0].rstrip("/").split("/")[-1]
+    tool_index().record(owner, repo, folder_url, tools)
+
+
+# Fetch a tool through tool_index(): one folder listing and one XML download
+def fetch_indexed_tool(owner, repo, tool_name, version):
+    hit = tool_index().lookup(owner, repo, tool_name, version)
+    if not hit:
+        return None
+    folder_url, xml_name = hit
+    context = get_folder_context(folder_url)
+    entry = get_file_entry(context.contents, xml_name)
+    tool = fetch_tool_entry(entry, context) if entry else None
+    if not tool or tool.id != tool_name:
+        logger.debug(f"Stale tool index entry for {owner}/{repo}/{tool_name}")
+        tool_index().delete(owner, repo, tool_name)
+        return None
+    return tool
+
+
+@lazy
+def tool_cache():
+    config = http_client.crawl_config()
+    return ToolInfoCache(
+        config.tool_cache,
+        maxsize=config.tool_cache_size,
+        max_age=config.tool_cache_max_age,
+        factory=ToolInfo,
+        missing_max_age=config.tool_cache_missing_max_age,
+    )
+
+
+# Cached by full toolshed uri across workflows, see tool_cache()
 def fetch_toolshed_tool(tool_uri: str) -> ToolInfo:
+    tool = tool_cache().get(tool_uri)
+    if tool is MISSING:
+        return None
+    if tool is not None:
+        return tool
+    tool = resolve_toolshed_tool(tool_uri)
+    if tool is None:
+        # Not in its repository, do not crawl it again for every workflow
+        tool_cache().put_missing(tool_uri)
+    else:
+        tool_cache().put(tool_uri, tool)
+    return tool
+
+
+def resolve_toolshed_tool(tool_uri: str) -> ToolInfo:
     _, owner, repo, tool_name, version = get_shed_uri_parts(tool_uri)
     # tool_name = get_shed_tool_name(tool_uri)
+    tool = fetch_indexed_tool(owner, repo, tool_name, version)
+    if tool:
+        tool.uri = tool_uri
+        if version != tool.version:
+            logger.warning(
+                f"Version mismatch for {tool_uri}: expected {version}, found {tool.version}"
+            )
+        return tool
+    # Not indexed yet, crawling the repository fills the index
     tool_meta = fetch_toolshed_tool_meta(tool_uri)[0]
     repo_api_url = convert_git_url_to_api(tool_meta["remote_repository_url"])
     if not repo_api_url:
@@ -320,7 +652,7 @@ def fetch_toolshed_tool_meta(tool_uri: str) -> dict:
         "changeset_revision": revision,
     }
 
-    r = requests.get(url, params=params, timeout=30)
+    r = shed_api_session().get(url, params=params, timeout=30)
     r.raise_for_status()
     return r.json()
 
@@ -330,7 +662,9 @@ def load_repositories(use_cache=True):
         logger.info("Loading registry from cache...")
         return load_json(CACHE_FILE)
 
-    repos = get_json(f"{TOOLShed}/api/repositories")
+    r = shed_api_session().get(f"{TOOLShed}/api/repositories", timeout=120)
+    r.raise_for_status()
+    repos = r.json()
     save_json(repos, CACHE_FILE)
     return repos
 
@@ -397,15 +731,20 @@ def get_unique_repositories():
     return unique_repos
 
 
-def get_file_url(contents, file_name):
+def get_file_entry(contents, file_name):
     for entry in contents:
         if "type" not in entry or "name" not in entry:
             continue
         if entry["type"] == "file" and entry["name"] == file_name:
-            return entry["download_url"]
+            return entry
     return None
 
 
+def get_file_url(contents, file_name):
+    entry = get_file_entry(contents, file_name)
+    return entry["download_url"] if entry else None
+
+
 def has_shed_yml(contents):
     for entry in contents:
         if "type" not in entry or "name" not in entry:
@@ -415,32 +754,114 @@ def has_shed_yml(contents):
     return False
 
 
-def get_shed_yml(git_url):
-    contents = get_json(git_url)
+def load_shed_yml(contents):
     for entry in contents:
         if "type" not in entry or "name" not in entry:
             continue
         if entry["type"] == "file" and entry["name"].lower() == ".shed.yml":
-            file_contents = fetch_text_file(entry["download_url"])
+            file_contents = fetch_entry_text(entry)
             data = yaml.safe_load(file_contents)
-            return data
+            return data or {}
     return {}
 
 
-def get_git_tree(repo_api_url):
-    parsed = urlparse(repo_api_url)
-    parts = parsed.path.strip("/").split("/")
-    owner = parts[1]
-    repo = parts[2]
-    r = requests.get(
+def get_shed_yml(git_url):
+    return get_folder_context(git_url).shed_yml
+
+
+class FolderContext:
+    """
+    Directory listing and .shed.yml of a tool folder. The .shed.yml is
+    fetched on first use and shared by every tool parsed from the folder.
+    """
+
+    def __init__(self, url, contents):
+        self.url = url
+        self.contents = contents
+        self._shed_yml = None
+        self._lock = threading.Lock()
+
+    @property
+    def shed_yml(self):
+        with self._lock:
+            if self._shed_yml is None:
+                self._shed_yml = load_shed_yml(self.contents)
+            return self._shed_yml
+
+
+FOLDER_CONTEXTS = LRUCache(maxsize=128)
+
+
+# Memoized FolderContext for a folder url. A freshly fetched listing
+# replaces the memoized one.
+def get_folder_context(url, contents=None):
+    if contents is None:
+        return FOLDER_CONTEXTS.get_or_load(
+            url, lambda: new_folder_context(url, list_directory(url))
+        )
+    context = FOLDER_CONTEXTS.get(url)
+    if context is None or context.contents is not contents:
+        context = new_folder_context(url, contents)
+        FOLDER_CONTEXTS.put(url, context)
+    return context
+
+
+# The files a tool folder lists keep their blobs alive in the blob store
+def new_folder_context(url, contents):
+    store = blob_store()
+    if store is not None:
+        store.set_refs(
+            url, [e.get("sha") for e in contents if e.get("type") == "file"]
+        )
+    return FolderContext(url, contents)
+
+
+def get_repo_owner_name(repo_api_url):
+    parts = urlparse(repo_api_url).path.strip("/").split("/")
+    return parts[1], parts[2]
+
+
+def get_default_branch(owner, repo):
+    r = http_client.get(
         f"https://api.github.com/repos/{owner}/{repo}",
         headers=HEADERS,
     )
     r.raise_for_status()
+    return r.json()["default_branch"]
+
+
+# Sha of the commit at the head of branch. The sha media type returns it as
+# plain text, without the diff of the commit.
+def get_head_commit(owner, repo, branch):
+    r = http_client.get(
+        f"https://api.github.com/repos/{owner}/{repo}/commits/{branch}",
+        headers={"Accept": "application/vnd.github.sha"},
+        timeout=30,
+    )
+    r.raise_for_status()
+    return r.text.strip()
+
 
-    branch = r.json()["default_branch"]
-    tree_url = f"https://api.github.com/repos/{owner}/{repo}/git/trees/{branch}"
-    r = requests.get(tree_url, params={"recursive": "1"}, timeout=30, headers=HEADERS)
+# Default branch of a repository and the commit at its head
+def get_repo_head(repo_api_url):
+    owner, repo = get_repo_owner_name(repo_api_url)
+    branch = get_default_branch(owner, repo)
+    return branch, get_head_commit(owner, repo, branch)
+
+
+# The tree of ref, the head of branch when not given. branch is looked up
+# when not given. A commit sha as ref names a tree that never changes, so it
+# is safe to cache.
+def get_git_tree(repo_api_url, ref=None, branch=None):
+    owner, repo = get_repo_owner_name(repo_api_url)
+    if branch is None:
+        branch = get_default_branch(owner, repo)
+    tree_url = (
+        f"https://api.github.com/repos/{owner}/{repo}/git/trees/{ref or branch}"
+    )
+    r = http_client.get(
+        tree_url, params={"recursive": "1"}, timeout=30, headers=HEADERS
+    )
     r.raise_for_status()
     return (branch, r.json())
 
@@ -452,7 +873,8 @@ def strip_query(url: str) -> str:
 
 def extract_base_path(repo_api_url: str) -> str:
     path = urlparse(repo_api_url).path
-    return path.split("/contents/", 1)[1].rstrip("/")
+    # Repository root URLs end in /contents without a trailing slash
+    return path.split("/contents", 1)[1].strip("/")
 
 
 def compare_base_path(base_path: str, item_path: str) -> bool:
@@ -466,25 +888,64 @@ def compare_base_path(base_path: str, item_path: str) -> bool:
     return True
 
 
-def get_tool_folders(repo_api_url):
-    branch, file_tree = get_git_tree(repo_api_url)
+def tool_folder_url(repo_api_url, base_path, folder, branch):
+    if folder.startswith(base_path):
+        folder = folder[len(base_path) :]
+    return f"{strip_query(repo_api_url)}/{folder}?ref={branch}"
+
+
+def get_tool_folder_shas(repo_api_url, branch=None, head_commit=None):
+    """
+    folder url -> git tree sha of every tool folder of a repository, read
+    from the tree at head_commit, or at the head of the default branch when
+    not given. Pass the branch and head commit from get_repo_head to save
+    the default branch lookup. The tree sha of a folder changes exactly when
+    something below it changes.
+    """
+    branch, file_tree = get_git_tree(repo_api_url, head_commit, branch)
+    if file_tree.get("truncated"):
+        logger.warning(
+            f"Git tree of {repo_api_url} is truncated, tool folders may be missing"
+        )
     base_path = extract_base_path(repo_api_url)
     file_list = file_tree.get("tree", [])
-    tool_folders = set()
+    tree_shas = {
+        item["path"]: item["sha"] for item in file_list if item["type"] == "tree"
+    }
+    # The response sha is the tree of the repository root
+    tree_shas[""] = file_tree.get("sha")
+    tool_folders = {}
     for item in file_list:
         if (
             item["type"] == "blob"
             and item["path"].lower().endswith(".shed.yml")
             and compare_base_path(base_path, item["path"])
         ):
-            folder = "/".join(item["path"].split("/")[:-1])
-            if folder.startswith(base_path):
-                folder = folder[len(base_path) :]
-            folder = f"{strip_query(repo_api_url)}/{folder}?ref={branch}"
+            path = "/".join(item["path"].split("/")[:-1])
+            folder = tool_folder_url(repo_api_url, base_path, path, branch)
             if folder:
                 logger.debug(f"Found tool url folder: {folder}")
-                tool_folders.add(folder)
-    return list(tool_folders)
+                tool_folders[folder] = tree_shas.get(path)
+    if not file_tree.get("truncated"):
+        prune_folder_refs(repo_api_url, tool_folders)
+    return tool_folders
+
+
+# Tool folders deleted from a repository are never listed again, drop their
+# refs so the blob store gc collects their blobs
+def prune_folder_refs(repo_api_url, tool_folders):
+    store = blob_store()
+    if store is None:
+        return
+    pruned = store.prune_refs(f"{strip_query(repo_api_url)}/", tool_folders)
+    if pruned:
+        logger.info(
+            f"Dropped blob refs of {pruned} removed tool folders of {repo_api_url}"
+        )
+
+
+def get_tool_folders(repo_api_url):
+    return list(get_tool_folder_shas(repo_api_url))
 
 
 # Crawl only the tool folders in a repository
@@ -504,54 +965,304 @@ def smart_crawl_repository(repo_api_url):
 
 
 # Generator version of s mart_crawl_repository
+# Tool folders are crawled concurrently (CRAWL_CONFIG.max_folders at a time)
+# and yielded in the order returned by get_tool_folders.
 def smart_crawl_repository_iter(repo_api_url):
+    if http_client.crawl_config().mode == "archive":
+        yield from archive_crawl_repository_iter(repo_api_url)
+        return
     tool_folders = get_tool_folders(repo_api_url)
     logger.debug(
         f"Smart crawling repository: {repo_api_url} with {
             len(tool_folders)
         } tool folders"
     )
-    for url in tool_folders:
-        tools = crawl_repository(url)
-        logger.debug(f"Found {len(tools)} tools in {url}")
-        yield (url, tools)
+    max_folders = http_client.crawl_config().max_folders
+    if max_folders <= 1:
+        for url in tool_folders:
+            tools = crawl_repository(url)
+            logger.debug(f"Found {len(tools)} tools in {url}")
+            yield (url, tools)
+        return
+
+    executor = ThreadPoolExecutor(
+        max_workers=max_folders, thread_name_prefix="crawl-folder"
+    )
+    try:
+        for url, tools in zip(
+            tool_folders, executor.map(crawl_repository, tool_folders)
+        ):
+            logger.debug(f"Found {len(tools)} tools in {url}")
+            yield (url, tools)
+    finally:
+        # The consumer may stop early, e.g. fetch_toolshed_tool
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Rate limiting is handled by http_client, which waits for the reset reported
+# by GitHub (60 requests per hour unauthenticated, 5000 authenticated)
+def list_directory(url):
+    response = http_client.get(url, timeout=30, headers=HEADERS)
+    logger.debug(f"Response status code: {response.status_code} for {url}")
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_tool_entry(entry, context):
+    xml = fetch_entry_text(entry)
+    return parse_xml(xml, context.contents, context.url, shed_yml=context.shed_yml)
+
+
+def fetch_parse_job(entry, context):
+    xml = fetch_entry_text(entry)
+    return make_parse_job(
+        xml, remote_macro_loader(context.contents), context.shed_yml, context.url
+    )
 
 
-# Recursively crawl a repository URL for Galaxy tool XML files
+def is_deprecated_url(url):
+    return "depricated" in url.lower()
+
+
+# Recursively crawl a repository URL for Galaxy tool XML files.
+# Sibling directory listings and the tool XMLs of a folder are fetched on the
+# shared crawl pool; tools are collected in the same order as a serial crawl.
 def crawl_repository(repo, collector=None):
     if collector is None:
         collector = []
-    if "depricated" in repo.lower():
+    if is_deprecated_url(repo):
         return collector
     logger.info(f"Crawling repository: {repo}")
-    response = requests.get(repo, timeout=30, headers=HEADERS)
-    logger.debug(f"Response status code: {response.status_code} for {repo}")
-    if response.status_code == 403:
-        logger.error(f"Rate limited when accessing {repo}")
-        logger.info("Sleeping for 1 hour to avoid rate limiting...")
-        sleep(
-            3610
-        )  # github rate limit for unauthenticated requests 60 requests per 1 hour and 5000 per hour for authenticated
-        return crawl_repository(repo, collector)
-
-    # If not 200 or 403, raise error
-    response.raise_for_status()
-    has_shed_file = has_shed_yml(response.json())
-    for entry in response.json():
-        if "type" not in entry or "name" not in entry:
-            continue
-        if (
-            entry["type"] == "file"
-            and entry["name"].lower().endswith(".xml")
-            and has_shed_file
-        ):
-            xml_url = entry["download_url"]
-            xml = fetch_xml(xml_url)
-            tool = parse_xml(xml, response.json(), repo)
-            if not tool:
-                continue
-            collector.append(tool)
-        if entry["type"] == "dir" and not has_shed_file:
-            dir_url = entry["url"]
-            crawl_repository(dir_url, collector)
+    crawl_listing(repo, list_directory(repo), collector)
     return collector
+
+
+def crawl_listing(repo, contents, collector):
+    entries = [e for e in contents if "type" in e and "name" in e]
+    if has_shed_yml(entries):
+        xml_entries = [
+            e
+            for e in entries
+            if e["type"] == "file" and e["name"].lower().endswith(".xml")
+        ]
+        context = get_folder_context(repo, contents)
+        # Resolve .shed.yml once before the tool XMLs are fetched
+        context.shed_yml
+        if get_parser_pool() is None:
+            tools = http_client.crawl_map(
+                lambda e: fetch_tool_entry(e, context), xml_entries
+            )
+        else:
+            jobs = http_client.crawl_map(
+                lambda e: fetch_parse_job(e, context), xml_entries
+            )
+            tools = parse_jobs(jobs)
+        index_folder_tools(
+            repo, context.shed_yml, [(e["name"], t) for e, t in zip(xml_entries, tools)]
+        )
+        collector.extend(tool for tool in tools if tool)
+        return
+
+    dir_urls = [
+        e["url"]
+        for e in entries
+        if e["type"] == "dir" and not is_deprecated_url(e["url"])
+    ]
+    for url in dir_urls:
+        logger.info(f"Crawling repository: {url}")
+    listings = http_client.crawl_map(list_directory, dir_urls)
+    for url, dir_contents in zip(dir_urls, listings):
+        crawl_listing(url, dir_contents, collector)
+
+
+# Archive based harvesting: one codeload tarball per owner/repo/branch instead
+# of a contents API request per folder and a download per file.
+def get_repo_branch(repo_api_url):
+    ref = parse_qs(urlparse(repo_api_url).query).get("ref")
+    if ref:
+        return ref[0]
+    return get_default_branch(*get_repo_owner_name(repo_api_url))
+
+
+def archive_path(owner, repo, branch):
+    safe_branch = branch.replace("/", "__")
+    return Path(http_client.crawl_config().archive_dir) / owner / repo / safe_branch
+
+
+def is_fresh(path, max_age):
+    return path.exists() and time.time() - path.stat().st_mtime < max_age
+
+
+# Extracted files keep the commit mtimes of the archive, the download time is
+# recorded on a marker file next to the extracted folder
+def archive_marker(target):
+    return target.with_name(f"{target.name}.downloaded")
+
+
+_archive_locks = {}
+_archive_locks_lock = threading.Lock()
+
+
+# One lock per owner/repo/branch, so the tool folders of a repository that
+# are crawled concurrently share a single download
+def archive_lock(target):
+    with _archive_locks_lock:
+        return _archive_locks.setdefault(target, threading.Lock())
+
+
+# Stream the repository tarball to disk and extract it. Returns the extracted
+# repository root folder.
+def download_repository_archive(owner, repo, branch):
+    target = archive_path(owner, repo, branch)
+    marker = archive_marker(target)
+    with archive_lock(target):
+        if target.exists() and is_fresh(
+            marker, http_client.crawl_config().archive_max_age
+        ):
+            logger.debug(f"Using extracted archive {target}")
+            return target
+
+        url = f"https://codeload.github.com/{owner}/{repo}/tar.gz/{branch}"
+        logger.info(f"Downloading repository archive: {url}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=target.parent) as tmp_dir:
+            tarball = Path(tmp_dir) / "archive.tar.gz"
+            with http_client.get(url, timeout=300, stream=True) as r:
+                r.raise_for_status()
+                with open(tarball, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+
+            extract_dir = Path(tmp_dir) / "extract"
+            with tarfile.open(tarball, "r:gz") as tf:
+                tf.extractall(extract_dir, filter="data")
+            # codeload archives contain a single {repo}-{branch} top folder
+            roots = list(extract_dir.iterdir())
+            root = roots[0] if len(roots) == 1 and roots[0].is_dir() else extract_dir
+            if target.exists():
+                # Move the stale tree aside, it is removed with tmp_dir
+                os.replace(target, Path(tmp_dir) / "stale")
+            os.replace(root, target)
+        marker.touch()
+    return target
+
+
+def read_local_text(path):
+    return path.read_text(encoding="utf-8", errors="replace")
+
+
+def find_local_shed_yml(folder):
+    for path in folder.iterdir():
+        if path.is_file() and path.name.lower() == ".shed.yml":
+            return path
+    return None
+
+
+def load_local_shed_yml(folder):
+    path = find_local_shed_yml(folder)
+    if not path:
+        return {}
+    try:
+        return yaml.safe_load(read_local_text(path)) or {}
+    except yaml.YAMLError as e:
+        logger.error(f"Error parsing {path}: {e}")
+        return {}
+
+
+def load_local_macro(folder, root, macro_file):
+    path = (folder / macro_file).resolve()
+    # Macro imports must not escape the extracted repository
+    if not path.is_relative_to(root.resolve()) or not path.is_file():
+        return None
+    key = ("file", str(path), path.stat().st_mtime_ns)
+    return macro_cache().get_or_load(
+        key, lambda: MacroFile(key, read_local_text(path), str(path))
+    )
+
+
+# Parse all tool XMLs of an extracted tool folder
+def crawl_local_folder(folder, root, folder_url):
+    shed_yml = load_local_shed_yml(folder)
+
+    def macro_loader(macro_file):
+        return load_local_macro(folder, root, macro_file)
+
+    xml_paths = [
+        path
+        for path in sorted(folder.iterdir())
+        if path.is_file() and path.name.lower().endswith(".xml")
+    ]
+    jobs = [
+        make_parse_job(read_local_text(path), macro_loader, shed_yml, folder_url)
+        for path in xml_paths
+    ]
+    tools = parse_jobs(jobs)
+    index_folder_tools(
+        folder_url, shed_yml, [(p.name, t) for p, t in zip(xml_paths, tools)]
+    )
+    return [tool for tool in tools if tool]
+
+
+def get_local_tool_folders(root, base_path):
+    base = root / base_path if base_path else root
+    if not base.is_dir():
+        return []
+    folders = set()
+    for path in base.rglob("*"):
+        if path.is_file() and path.name.lower() == ".shed.yml":
+            folders.add(path.parent)
+    return sorted(folders)
+
+
+# Crawl a single tool folder url as returned by get_tool_folders, through the
+# contents API or the repository archive depending on the crawl mode
+def crawl_tool_folder(url):
+    if http_client.crawl_config().mode != "archive":
+        return crawl_repository(url)
+    if is_deprecated_url(url):
+        return []
+    owner, repo = get_repo_owner_name(url)
+    root = download_repository_archive(owner, repo, get_repo_branch(url))
+    folder = root / extract_base_path(url)
+    if not folder.is_dir():
+        logger.warning(f"Tool folder {url} not found in archive {root}")
+        return []
+    return crawl_local_folder(folder, root, url)
+
+
+# Archive version of smart_crawl_repository_iter, yields (url, tools) for
+# the same tool folder urls as get_tool_folders
+def archive_crawl_repository_iter(repo_api_url):
+    owner, repo = get_repo_owner_name(repo_api_url)
+    branch = get_repo_branch(repo_api_url)
+    base_path = extract_base_path(repo_api_url)
+    root = download_repository_archive(owner, repo, branch)
+    tool_folders = get_local_tool_folders(root, base_path)
+    logger.debug(
+        f"Archive crawling repository: {repo_api_url} with {
+            len(tool_folders)
+        } tool folders"
+    )
+    for folder in tool_folders:
+        rel_folder = folder.relative_to(root).as_posix()
+        url = tool_folder_url(repo_api_url, base_path, rel_folder, branch)
+        if is_deprecated_url(url):
+            continue
+        tools = crawl_local_folder(folder, root, url)
+        logger.debug(f"Found {len(tools)} tools in {url}")
+        yield (url, tools)
+
+
+# Module level names of the former import time globals
+_LAZY_ATTRIBUTES = {
+    "SHED_API_SESSION": shed_api_session,
+    "MACRO_CACHE": macro_cache,
+    "TOOL_INDEX": tool_index,
+    "TOOL_CACHE": tool_cache,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,5 +1,7 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from toolmeta_harvester.adaptors import galaxy_toolshed as shed
+from toolmeta_harvester.config import load_workflow_hub_config
 
 logger = logging.getLogger(__name__)
 
@@ -96,8 +98,32 @@ def get_outputs(ga):
     return outputs
 
 
-def get_shed_outputs(ga):
+def fetch_shed_tool(tool_uri):
+    try:
+        return shed.fetch_toolshed_tool(tool_uri)
+    except Exception as e:
+        return e
+
+
+# Resolve the distinct ToolShed uris concurrently. Returns {tool_uri: ToolInfo,
+# None or the exception raised}, so a failing tool does not affect the others.
+def resolve_shed_tools(tool_ids):
+    tool_uris = list(dict.fromkeys(t for t in tool_ids if is_shed_uri(t)))
+    workers = min(
+        load_workflow_hub_config().workflow_tool_workers, len(tool_uris)
+    )
+    if workers <= 1:
+        return {uri: fetch_shed_tool(uri) for uri in tool_uris}
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="resolve-tool"
+    ) as executor:
+        return dict(zip(tool_uris, executor.map(fetch_shed_tool, tool_uris)))
+
+
+def get_shed_outputs(ga, resolved=None):
     outputs_steps = get_outputs(ga)
+    if resolved is None:
+        resolved = resolve_shed_tools(o.get("tool_id", "") for o in outputs_steps)
     output_tools = []
     seen = set()
     for output in outputs_steps:
@@ -110,16 +136,14 @@ def get_shed_outputs(ga):
         tool_uri = tool_id
         if tool_uri in seen:
             continue
-        try:
-            tool = shed.fetch_toolshed_tool(tool_uri)
-            if tool:
-                output_tools.append(tool)
-                seen.add(tool_uri)
-                continue
-        except Exception:
+        tool = resolved.get(tool_uri)
+        if isinstance(tool, Exception):
             logger.warning(f"Error retrieving output shed tool: {
                              tool_uri}, skipping...")
             continue
+        if tool:
+            output_tools.append(tool)
+            seen.add(tool_uri)
     return output_tools
 
 
@@ -144,8 +168,10 @@ def get_inputs(ga):
     return inputs
 
 
-def get_shed_inputs(ga):
+def get_shed_inputs(ga, resolved=None):
     input_tool_ids = get_tools_connected_to_inputs(ga)
+    if resolved is None:
+        resolved = resolve_shed_tools(input_tool_ids)
     input_tools = []
     seen = set()
     for tool_id in input_tool_ids:
@@ -156,17 +182,15 @@ def get_shed_inputs(ga):
         tool_uri = tool_id
         if tool_uri in seen:
             continue
-        try:
-            tool = shed.fetch_toolshed_tool(tool_uri)
-            if tool:
-                input_tools.append(tool)
-                seen.add(tool_uri)
-                logger.debug(f"Added input tool: {tool}")
-                continue
-        except Exception:
+        tool = resolved.get(tool_uri)
+        if isinstance(tool, Exception):
             logger.warning(f"Error retrieving input shed tool: {
                              tool_uri}, skipping...")
             continue
+        if tool:
+            input_tools.append(tool)
+            seen.add(tool_uri)
+            logger.debug(f"Added input tool: {tool}")
     return input_tools
 
 
@@ -180,7 +204,12 @@ def parse_workflow(ga) -> WorkflowInfo:
     wf_info.description = ga.get("description", "")
     wf_info.toolshed_tools = get_step_shed_tools(ga)
 
-    input_tools = get_shed_inputs(ga)
+    # Input and output tools are resolved together, concurrently
+    resolved = resolve_shed_tools(
+        get_tools_connected_to_inputs(ga)
+        + [o.get("tool_id", "") for o in get_outputs(ga)]
+    )
+    input_tools = get_shed_inputs(ga, resolved)
     wf_info.input_tools = input_tools
     input_formats = set()
     for tool in input_tools:
@@ -198,7 +227,7 @@ def parse_workflow(ga) -> WorkflowInfo:
     #         input_formats.add(data_type.lower())
     # wf_info.input_formats = list(input_formats)
 
-    output_tools = get_shed_outputs(ga)
+    output_tools = get_shed_outputs(ga, resolved)
     wf_info.output_tools = output_tools
     output_formats = set()
     for tool in output_tools:
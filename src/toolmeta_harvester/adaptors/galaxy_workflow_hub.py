@@ -1,11 +1,13 @@
 import logging
 import requests
-import requests_cache
 import json
 from pathlib import Path
 import zipfile
 import io
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
 from toolmeta_harvester.adaptors import galaxy_workflow as ga_workflow
+from toolmeta_harvester.adaptors.caching import lazy
 
 logger = logging.getLogger(__name__)
 
@@ -17,22 +19,58 @@ HEADERS = {
     "Accept": "application/json",
 }
 
-# Initialize requests cache
-requests_cache.install_cache(
-    "cache/workflowhub_org_cache", backend="sqlite", expire_after=86400
-)
+
+# Cache for the WorkflowHub API, see [http_cache.workflow_hub]. Only requests
+# made through this session are cached, nothing is installed globally.
+@lazy
+def hub_session():
+    from toolmeta_harvester.adaptors.http_cache import cached_session
+
+    return cached_session("workflow_hub")
+
+
+# Range requests bypass the requests cache, which does not key responses on the
+# Range header
+@lazy
+def range_session():
+    return requests.Session()
+
+
+def fetch_page(url):
+    r = hub_session().get(url, timeout=30, headers=HEADERS)
+    r.raise_for_status()
+    return r.json(), r.headers.get("next_page", None)
+
+
+# Yield the entries of a paginated listing as pages arrive, following the
+# next_page header. With prefetch the next page is downloaded while the
+# entries of the current page are processed.
+def iter_pages(url, prefetch=True):
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hub-page")
+    seen = {url}
+    try:
+        future = executor.submit(fetch_page, url)
+        while future:
+            entries, next_page = future.result()
+            future = None
+            if next_page in seen:
+                logger.warning(f"Pagination loop at {next_page}, stopping")
+                next_page = None
+            if next_page:
+                seen.add(next_page)
+                if prefetch:
+                    future = executor.submit(fetch_page, next_page)
+            yield from entries
+            if next_page and not prefetch:
+                future = executor.submit(fetch_page, next_page)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 def get_json(url, result=None):
     if not result:
         result = []
-    r = requests.get(url, timeout=30, headers=HEADERS)
-    r.raise_for_status()
-    result.extend(r.json())
-    next_page = r.headers.get("next_page", None)
-    if next_page:
-        get_json(next_page, result)
-
+    result.extend(iter_pages(url))
     return result
 
 
@@ -51,25 +89,34 @@ def is_cached(filename):
 
 
 def fetch_text_file(url):
-    r = requests.get(url, timeout=30, headers=HEADERS)
+    r = hub_session().get(url, timeout=30, headers=HEADERS)
     r.raise_for_status()
     return r.text
 
 
 def retrieve_json(url, cache_file, use_cache=True):
+    return list(iter_json(url, cache_file, use_cache))
+
+
+# Streaming version of retrieve_json. The cache file is written once the
+# whole listing has been consumed.
+def iter_json(url, cache_file, use_cache=True):
     if use_cache and is_cached(cache_file):
         logger.info("Loading registry from cache...")
-        return load_json(cache_file)
-    workflows = get_json(url)
+        yield from load_json(cache_file)
+        return
+    workflows = []
+    for entry in iter_pages(url):
+        workflows.append(entry)
+        yield entry
     save_json(workflows, cache_file)
-    return workflows
 
 
 # Extract Galaxy workflow from ZIP file at given URL
 
 
 def extract_galaxy_workflow_from_zip(url):
-    response = requests.get(url, timeout=30)
+    response = hub_session().get(url, timeout=30)
     response.raise_for_status()
 
     # Open ZIP in memory
@@ -86,29 +133,173 @@ def extract_galaxy_workflow_from_zip(url):
             return json.load(ga_file)
 
 
+class RangeNotSupported(ValueError):
+    pass
+
+
+class HttpRangeFile(io.RawIOBase):
+    """
+    Read only, seekable file over HTTP range requests. Lets zipfile read the
+    central directory and a single member without downloading the archive.
+    """
+
+    def __init__(self, url, size, session=None):
+        self.url = url
+        self.size = size
+        self.session = session or range_session()
+        self.position = 0
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        # Streamed, so a server ignoring Range does not send the whole body
+        with self.session.get(
+            self.url,
+            headers={"Range": f"bytes={self.position}-{end}"},
+            timeout=30,
+            stream=True,
+        ) as r:
+            r.raise_for_status()
+            content_range = r.headers.get("Content-Range", "")
+            if r.status_code != 206 or not content_range.startswith(
+                f"bytes {self.position}-"
+            ):
+                raise RangeNotSupported(
+                    f"Range request not honoured by {self.url} "
+                    f"(status {r.status_code}, Content-Range {content_range!r})"
+                )
+            data = r.content[: len(buffer)]
+        if not data:
+            raise RangeNotSupported(f"Empty range response from {self.url}")
+        buffer[: len(data)] = data
+        self.position += len(data)
+        self.bytes_read += len(data)
+        return len(data)
+
+
+# Open a remote ZIP with range requests. Returns None when the server does
+# not support them.
+def open_remote_zip(url):
+    r = range_session().head(url, allow_redirects=True, timeout=30)
+    r.raise_for_status()
+    size = int(r.headers.get("Content-Length", 0))
+    if r.headers.get("Accept-Ranges", "").lower() != "bytes" or not size:
+        return None
+    raw = HttpRangeFile(r.url, size)
+    return raw, io.BufferedReader(raw, buffer_size=64 * 1024)
+
+
+# Read the first .ga member of a remote ZIP through range requests, falling
+# back to downloading the whole archive when ranges are not supported
+def extract_galaxy_workflow_from_remote_zip(url):
+    remote = open_remote_zip(url)
+    if not remote:
+        logger.debug(f"No range support for {url}, downloading archive")
+        return extract_galaxy_workflow_from_zip(url)
+    raw, reader = remote
+    try:
+        with zipfile.ZipFile(reader) as zf:
+            ga_files = [name for name in zf.namelist() if name.endswith(".ga")]
+            if not ga_files:
+                raise ValueError("No .ga Galaxy workflow file found in ZIP")
+            with zf.open(ga_files[0]) as ga_file:
+                ga = json.load(ga_file)
+    except RangeNotSupported as e:
+        # Advertised Accept-Ranges but answered otherwise
+        logger.debug(f"{e}, downloading archive")
+        return extract_galaxy_workflow_from_zip(url)
+    logger.debug(f"Read {raw.bytes_read} of {raw.size} bytes from {url}")
+    return ga
+
+
+def get_trs_descriptor_url(w, version):
+    tool_id = quote(str(w["id"]), safe="")
+    version_id = quote(str(version["id"]), safe="")
+    return (
+        f"{WORKFLOW_HUB_API}tools/{tool_id}/versions/{version_id}/GALAXY/descriptor"
+    )
+
+
+# Fetch the .ga workflow from the TRS descriptor endpoint. Returns None when
+# the endpoint has no usable Galaxy descriptor for the entry or fails, the
+# caller then falls back to the archive.
+def fetch_trs_descriptor(w):
+    versions = w.get("versions") or []
+    if "id" not in w or not versions:
+        return None
+    # The archive download serves the latest version, the last one listed
+    url = get_trs_descriptor_url(w, versions[-1])
+    r = hub_session().get(url, timeout=30, headers=HEADERS)
+    if not r.ok:
+        logger.info(
+            f"TRS descriptor {url} returned {r.status_code}, using the archive"
+        )
+        return None
+    try:
+        content = r.json().get("content")
+    except ValueError:
+        logger.debug(f"TRS descriptor {url} is not JSON")
+        return None
+    if not content:
+        return None
+    try:
+        ga = json.loads(content)
+    except json.JSONDecodeError:
+        # e.g. a gxformat2 YAML workflow
+        return None
+    if not isinstance(ga, dict) or "steps" not in ga:
+        return None
+    return ga
+
+
 # Get workflows from Workflow Hub, optionally filtering by type
 
 
+# Generator, entries are yielded while the listing is paged
 def get_hub_workflows(type=None):
-    workflows = retrieve_json(f"{WORKFLOW_HUB_API}/tools/", HUB_CACHE_FILE, True)
-    if not type:
-        return workflows
-    results = []
+    workflows = iter_json(f"{WORKFLOW_HUB_API}/tools/", HUB_CACHE_FILE, True)
     for w in workflows:
-        workflow_types = w["versions"][0]["descriptor_type"]
-        workflow_type = workflow_types[0].lower() if len(workflow_types) > 0 else None
-        if workflow_type != type.lower():
-            continue
-        results.append(w)
-    return results
+        if type:
+            workflow_types = w["versions"][0]["descriptor_type"]
+            workflow_type = (
+                workflow_types[0].lower() if len(workflow_types) > 0 else None
+            )
+            if workflow_type != type.lower():
+                continue
+        yield w
 
 
 # Get Galaxy workflow from Workflow Hub entry
 
 
+# Only the .ga descriptor is transferred: through the TRS descriptor endpoint
+# when available, otherwise by range reads of the RO-Crate ZIP
 def get_ga_workflow(w):
+    ga_workflow = fetch_trs_descriptor(w)
+    if ga_workflow is not None:
+        return ga_workflow
     download_url = f"{w['url']}/download"
-    ga_workflow = extract_galaxy_workflow_from_zip(download_url)
+    ga_workflow = extract_galaxy_workflow_from_remote_zip(download_url)
     return ga_workflow
 
 
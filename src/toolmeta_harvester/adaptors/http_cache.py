@@ -0,0 +1,216 @@
+"""
+Per adaptor HTTP caches. Every adaptor owns a CachedSession with its own
+sqlite file, expiry per url pattern and a filter keeping large or binary
+downloads out of the cache. Next to the requests_cache tables the file holds
+the last access time of every entry and the hit/miss counters, used to evict
+the least recently used entries once the cache grows over its size cap.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from requests_cache import DO_NOT_CACHE, CachedSession
+from toolmeta_harvester.config import NOT_CACHED, load_http_cache_config
+
+logger = logging.getLogger(__name__)
+
+# Pending access times and counters are written every n requests
+FLUSH_INTERVAL = 50
+
+
+# requests_cache expiry of a urls_expire_after value
+def url_expiry(ttl):
+    return DO_NOT_CACHE if ttl == NOT_CACHED else ttl
+
+
+def cache_filter(config):
+    max_bytes = config.max_response_kb * 1024
+
+    def filter_fn(response):
+        content_type = response.headers.get("Content-Type", "")
+        if content_type.split(";")[0].strip().lower() in config.excluded_content_types:
+            return False
+        size = response.headers.get("Content-Length")
+        if size is None and isinstance(getattr(response, "_content", None), bytes):
+            size = len(response._content)
+        return size is None or int(size) <= max_bytes
+
+    return filter_fn
+
+
+class CacheStore:
+    """
+    Access log and counters of one cache, stored in the cache's sqlite file.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._hits = 0
+        self._misses = 0
+        with self._connect() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS cache_access ("
+                " key TEXT PRIMARY KEY, accessed REAL NOT NULL)"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS cache_stats ("
+                " name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    # Returns True when the pending records should be flushed
+    def record(self, key, from_cache):
+        with self._lock:
+            if key:
+                self._accessed[key] = time.time()
+            if from_cache:
+                self._hits += 1
+            else:
+                self._misses += 1
+            return len(self._accessed) + self._hits + self._misses >= FLUSH_INTERVAL
+
+    def flush(self):
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+            counters = {"hits": self._hits, "misses": self._misses}
+            self._hits = self._misses = 0
+        with self._connect() as con:
+            con.executemany(
+                "INSERT INTO cache_access (key, accessed) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET accessed = excluded.accessed",
+                accessed.items(),
+            )
+            self.add_counters(con, counters)
+
+    def add_counters(self, con, counters):
+        con.executemany(
+            "INSERT INTO cache_stats (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            counters.items(),
+        )
+
+    def counters(self):
+        with self._connect() as con:
+            return dict(con.execute("SELECT name, value FROM cache_stats"))
+
+    def payload_size(self):
+        with self._connect() as con:
+            row = con.execute("SELECT SUM(LENGTH(value)) FROM responses").fetchone()
+        return row[0] or 0
+
+    # Keys in least recently used order, entries never accessed through the
+    # access log first
+    def lru_keys(self):
+        with self._connect() as con:
+            return con.execute(
+                "SELECT r.key, LENGTH(r.value) FROM responses r"
+                " LEFT JOIN cache_access a ON a.key = r.key"
+                " ORDER BY COALESCE(a.accessed, 0)"
+            ).fetchall()
+
+    def prune_access(self):
+        with self._connect() as con:
+            con.execute(
+                "DELETE FROM cache_access"
+                " WHERE key NOT IN (SELECT key FROM responses)"
+            )
+
+
+class HttpCacheSession(CachedSession):
+    """
+    CachedSession recording hits, misses and access times, and keeping the
+    cache under its size cap.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        super().__init__(
+            config.path,
+            backend="sqlite",
+            expire_after=config.expire_after,
+            urls_expire_after={
+                pattern: url_expiry(ttl)
+                for pattern, ttl in (config.urls_expire_after or {}).items()
+            },
+            filter_fn=cache_filter(config),
+        )
+        self.store = CacheStore(self.cache.responses.db_path)
+        self._requests = 0
+        self._evict_lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        from_cache = getattr(response, "from_cache", False)
+        if self.store.record(getattr(response, "cache_key", None), from_cache):
+            self.store.flush()
+        with self._evict_lock:
+            self._requests += 1
+            check = self._requests % self.config.evict_interval == 0
+        if check:
+            self.evict()
+        return response
+
+    def evict(self, vacuum=False):
+        """
+        Drop expired entries, then least recently used ones until the cache
+        payload fits in max_size_mb. Returns the number of entries removed.
+        """
+        self.store.flush()
+        before = self.cache.responses.count()
+        self.cache.delete(expired=True, vacuum=False)
+        max_bytes = self.config.max_size_mb * 1024 * 1024
+        size = self.store.payload_size()
+        evicted = []
+        if size > max_bytes:
+            # Evict down to 90% of the cap so eviction does not run on every write
+            target = max_bytes * 0.9
+            for key, length in self.store.lru_keys():
+                if size <= target:
+                    break
+                evicted.append(key)
+                size -= length or 0
+            self.cache.responses.bulk_delete(evicted)
+        removed = before - self.cache.responses.count()
+        if removed:
+            self.store.prune_access()
+            with self.store._connect() as con:
+                self.store.add_counters(con, {"evicted": removed})
+            logger.info(
+                f"HTTP cache {self.config.name}: removed {removed} entries, "
+                f"{len(evicted)} by LRU, payload {size / 2**20:.1f} MB"
+            )
+        if vacuum or removed:
+            self.cache.responses.vacuum()
+        return removed
+
+    def stats(self):
+        self.store.flush()
+        counters = self.store.counters()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "name": self.config.name,
+            "path": self.cache.responses.db_path,
+            "entries": self.cache.responses.count(),
+            "expired": self.cache.responses.count() - self.cache.responses.count(expired=False),
+            "payload_bytes": self.store.payload_size(),
+            "file_bytes": self.cache.responses.size(),
+            "max_bytes": self.config.max_size_mb * 1024 * 1024,
+            "hits": hits,
+            "misses": misses,
+            "evicted": counters.get("evicted", 0),
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def close(self):
+        self.store.flush()
+        super().close()
+
+
+def cached_session(name):
+    return HttpCacheSession(load_http_cache_config(name))
@@ -0,0 +1,378 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from toolmeta_harvester.config import load_crawl_config, load_git_config
+from toolmeta_harvester.adaptors.caching import lazy
+from toolmeta_harvester.adaptors.validator_store import ValidatorStore
+
+logger = logging.getLogger(__name__)
+
+# Hosts that receive a token from the GitHub token pool
+GITHUB_HOSTS = {"api.github.com", "raw.githubusercontent.com"}
+# Log the token pool usage every n GitHub requests
+TOKEN_USAGE_LOG_INTERVAL = 500
+
+
+class RateLimitScheduler:
+    """
+    Token bucket pacing the requests sent to one host.
+    The refill rate follows the X-RateLimit-Remaining/X-RateLimit-Reset
+    headers so the remaining quota is spread over the time left in the
+    window. When the quota is spent or the host sends Retry-After, requests
+    wait until the reported time instead of a fixed sleep.
+    """
+
+    def __init__(self, host, rate, burst, reserve):
+        self.host = host
+        self.default_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.tokens = float(burst)
+        self.remaining = None
+        self.reset_at = None
+        self.blocked_until = 0.0
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(now - self._updated, 0.0)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                if self.blocked_until > now:
+                    wait = self.blocked_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def block_until(self, until):
+        with self._lock:
+            if until <= self.blocked_until:
+                return
+            self.blocked_until = until
+            # Start the new window with the default pace
+            self.rate = self.default_rate
+            self.tokens = 0.0
+            self._updated = until
+        logger.warning(
+            f"Rate limit reached for {self.host}, waiting {
+                max(until - time.time(), 0):.0f
+            }s until reset"
+        )
+
+    def update(self, response):
+        headers = response.headers
+        now = time.time()
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is not None and reset is not None:
+            remaining = int(remaining)
+            reset_at = float(reset)
+            with self._lock:
+                self.remaining = remaining
+                self.reset_at = reset_at
+                window = max(reset_at - now, 1.0)
+                usable = remaining - self.reserve
+                if usable > 0:
+                    self.rate = usable / window
+            if remaining <= self.reserve:
+                self.block_until(reset_at + 1)
+
+        retry_after = headers.get("Retry-After")
+        if retry_after:
+            try:
+                self.block_until(now + float(retry_after))
+            except ValueError:
+                logger.debug(f"Ignoring Retry-After header: {retry_after}")
+
+    def is_rate_limited(self, response):
+        if response.status_code not in (403, 429):
+            return False
+        return (
+            response.headers.get("X-RateLimit-Remaining") == "0"
+            or "Retry-After" in response.headers
+        )
+
+
+@dataclass
+class TokenState:
+    name: str
+    token: str
+    remaining: int = None
+    limit: int = None
+    reset_at: float = 0.0
+    requests: int = 0
+    exhausted: int = 0
+
+    def is_available(self, reserve, now):
+        if self.remaining is None or self.reset_at <= now:
+            return True
+        return self.remaining > reserve
+
+
+class TokenPool:
+    """
+    Rotates GitHub requests across the configured tokens.
+    Each request takes the token with the most remaining quota, so the
+    hourly limit grows with the number of tokens. Exhausted tokens are
+    skipped until their reset time.
+    """
+
+    def __init__(self, tokens, reserve):
+        self.reserve = reserve
+        self.tokens = [
+            # Never log full tokens
+            TokenState(name=f"token-{i}-{token[-4:]}", token=token)
+            for i, token in enumerate(tokens, start=1)
+        ]
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.tokens:
+            return None
+        with self._lock:
+            now = time.time()
+            available = [t for t in self.tokens if t.is_available(self.reserve, now)]
+            if available:
+                # Unknown quota counts as full, so fresh tokens are tried first
+                state = max(
+                    available,
+                    key=lambda t: float("inf") if t.remaining is None else t.remaining,
+                )
+            else:
+                # All tokens are spent, the scheduler waits for the first reset
+                state = min(self.tokens, key=lambda t: t.reset_at)
+            state.requests += 1
+            self.requests += 1
+            log_usage = self.requests % TOKEN_USAGE_LOG_INTERVAL == 0
+        if log_usage:
+            self.log_usage()
+        return state
+
+    def update(self, state, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if state is None or remaining is None or reset is None:
+            return
+        limit = response.headers.get("X-RateLimit-Limit")
+        with self._lock:
+            state.remaining = int(remaining)
+            state.reset_at = float(reset)
+            state.limit = int(limit) if limit else state.limit
+            exhausted = state.remaining <= self.reserve
+            if exhausted:
+                state.exhausted += 1
+        if exhausted:
+            logger.warning(
+                f"GitHub {state.name} exhausted, resets in {
+                    max(state.reset_at - time.time(), 0):.0f
+                }s"
+            )
+
+    def stats(self):
+        with self._lock:
+            return [
+                {
+                    "name": t.name,
+                    "requests": t.requests,
+                    "remaining": t.remaining,
+                    "limit": t.limit,
+                    "reset_at": t.reset_at,
+                    "exhausted": t.exhausted,
+                }
+                for t in self.tokens
+            ]
+
+    def log_usage(self):
+        for t in self.stats():
+            logger.info(
+                f"GitHub {t['name']}: {t['requests']} requests, "
+                f"remaining {t['remaining']}/{t['limit']}, "
+                f"exhausted {t['exhausted']} times"
+            )
+
+
+def request_url(url, params=None):
+    return requests.Request("GET", url, params=params).prepare().url
+
+
+# Rebuild a 200 response from the validator store after a 304
+def response_from_store(entry, response):
+    stored = requests.Response()
+    stored.status_code = 200
+    stored.reason = "OK"
+    stored._content = entry["body"]
+    stored.headers = CaseInsensitiveDict(entry["headers"])
+    for k, v in response.headers.items():
+        if k.lower().startswith("x-ratelimit"):
+            stored.headers[k] = v
+    stored.encoding = get_encoding_from_headers(stored.headers)
+    stored.url = response.url
+    stored.request = response.request
+    return stored
+
+
+class HttpClient:
+    """
+    Crawl state shared by the adaptors: the HTTP session, per host request
+    slots and rate limit schedulers, the GitHub token pool, the validator
+    store and the crawl thread pool. Nothing touches the network, the disk or
+    the settings before the client is created, see get_client().
+    """
+
+    def __init__(self, config, api_keys=()):
+        self.config = config
+        self.token_pool = TokenPool(api_keys, reserve=config.rate_limit_reserve)
+        # GitHub responses are revalidated through the validator store
+        # instead of a time based requests_cache
+        self.validator_store = ValidatorStore(config.validator_store)
+        self.session = self.create_session()
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+        self._schedulers = {}
+        self._schedulers_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def create_session(self):
+        session = requests.Session()
+        pool_size = max(
+            [self.config.max_workers, self.config.max_per_host]
+            + [int(v) for v in self.config.host_limits.values()]
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def host_limit(self, host):
+        return int(self.config.host_limits.get(host, self.config.max_per_host))
+
+    # Semaphore bounding the number of in-flight requests to a single host
+    def host_slot(self, url):
+        host = urlparse(url).netloc
+        with self._host_slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(max(1, self.host_limit(host)))
+                self._host_slots[host] = slot
+        return slot
+
+    # Rate limits are tracked per host and, for GitHub, per token
+    def get_scheduler(self, url, token=None):
+        host = urlparse(url).netloc
+        key = (host, token.name if token else None)
+        with self._schedulers_lock:
+            scheduler = self._schedulers.get(key)
+            if scheduler is None:
+                scheduler = RateLimitScheduler(
+                    host if token is None else f"{host} ({token.name})",
+                    rate=self.config.default_rate,
+                    burst=self.config.burst,
+                    reserve=self.config.rate_limit_reserve,
+                )
+                self._schedulers[key] = scheduler
+        return scheduler
+
+    # GET through the host's rate limit scheduler. Rate limited responses are
+    # retried once the limit resets; other errors are left to the caller.
+    # GitHub requests are authenticated with a token from the token pool and,
+    # unless streamed, sent as conditional requests against the validator store.
+    def get(self, url, headers=None, **kwargs):
+        kwargs.setdefault("timeout", 30)
+        is_github = urlparse(url).netloc in GITHUB_HOSTS
+        conditional = is_github and not kwargs.get("stream")
+        entry = None
+        if conditional:
+            full_url = request_url(url, kwargs.get("params"))
+            entry = self.validator_store.get(full_url)
+        for attempt in range(self.config.max_retries + 1):
+            token = self.token_pool.acquire() if is_github else None
+            scheduler = self.get_scheduler(url, token)
+            request_headers = dict(headers or {})
+            if token:
+                request_headers["Authorization"] = f"Bearer {token.token}"
+            request_headers.update(self.validator_store.conditional_headers(entry))
+            scheduler.acquire()
+            with self.host_slot(url):
+                response = self.session.get(url, headers=request_headers, **kwargs)
+            scheduler.update(response)
+            self.token_pool.update(token, response)
+            if not scheduler.is_rate_limited(response):
+                if conditional and response.status_code == 304 and entry:
+                    logger.debug(f"Not modified: {url}")
+                    return response_from_store(entry, response)
+                if conditional and response.status_code == 200:
+                    self.validator_store.put(full_url, response)
+                return response
+            logger.error(f"Rate limited when accessing {url}")
+            if attempt < self.config.max_retries:
+                response.close()
+        return response
+
+    def get_crawl_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.config.max_workers,
+                    thread_name_prefix="crawl",
+                )
+        return self._executor
+
+    # Ordered map over the shared crawl pool. Only leaf work (requests and
+    # parsing) may be submitted here; a task that calls crawl_map itself
+    # would wait on the pool it occupies.
+    def crawl_map(self, fn, items):
+        items = list(items)
+        if self.config.max_workers <= 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        return list(self.get_crawl_executor().map(fn, items))
+
+
+@lazy
+def get_client():
+    return HttpClient(load_crawl_config(), load_git_config().api_keys)
+
+
+def crawl_config():
+    return get_client().config
+
+
+def get(url, headers=None, **kwargs):
+    return get_client().get(url, headers=headers, **kwargs)
+
+
+def crawl_map(fn, items):
+    return get_client().crawl_map(fn, items)
+
+
+# Module level names of the former import time globals
+_CLIENT_ATTRIBUTES = {
+    "CRAWL_CONFIG": "config",
+    "TOKEN_POOL": "token_pool",
+    "VALIDATOR_STORE": "validator_store",
+    "SESSION": "session",
+}
+
+
+def __getattr__(name):
+    if name in _CLIENT_ATTRIBUTES:
+        return getattr(get_client(), _CLIENT_ATTRIBUTES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,128 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from toolmeta_harvester.adaptors.caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Returned by get for a uri that was recently looked up and not found
+MISSING = object()
+
+
+class ToolInfoCache:
+    """
+    Resolved ToolInfo objects keyed by full toolshed uri. An in memory LRU
+    sits in front of a sqlite table so popular tools are resolved once
+    across workflows and runs. Entries older than max_age are refetched.
+    Lookups that found no tool are remembered for missing_max_age, so a
+    missing tool does not trigger a repository crawl for every workflow.
+    """
+
+    def __init__(self, path, maxsize, max_age, factory, missing_max_age=86400):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self.missing_max_age = missing_max_age
+        self.factory = factory
+        self.memory = LRUCache(maxsize=maxsize)
+        # uri -> time the negative entry expires
+        self.missing = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tools (
+                uri TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS missing (
+                uri TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    # The cached ToolInfo, MISSING for a recent negative lookup, otherwise None
+    def get(self, uri):
+        tool = self.memory.get(uri)
+        if tool is None and self.missing.get(uri, 0) > time.time():
+            tool = MISSING
+        if tool is not None:
+            with self._lock:
+                self.hits += 1
+            return tool
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM tools WHERE uri = ? AND updated_at > ?",
+                (uri, time.time() - self.max_age),
+            ).fetchone()
+            if not row:
+                missing = self._conn.execute(
+                    "SELECT updated_at FROM missing WHERE uri = ? AND updated_at > ?",
+                    (uri, time.time() - self.missing_max_age),
+                ).fetchone()
+                if not missing:
+                    self.misses += 1
+                    return None
+                self.disk_hits += 1
+                self.missing.put(uri, missing[0] + self.missing_max_age)
+                return MISSING
+            self.disk_hits += 1
+        tool = self.factory(**json.loads(row[0]))
+        self.memory.put(uri, tool)
+        return tool
+
+    def put(self, uri, tool):
+        self.memory.put(uri, tool)
+        self.missing.pop(uri)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tools (uri, data, updated_at) "
+                "VALUES (?, ?, ?)",
+                (uri, json.dumps(asdict(tool)), time.time()),
+            )
+            self._conn.execute("DELETE FROM missing WHERE uri = ?", (uri,))
+            self._conn.commit()
+
+    def put_missing(self, uri):
+        now = time.time()
+        self.missing.put(uri, now + self.missing_max_age)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO missing (uri, updated_at) VALUES (?, ?)",
+                (uri, now),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_size": len(self.memory),
+            }
+
+    def log_stats(self):
+        s = self.stats()
+        logger.info(
+            f"ToolInfo cache: {s['memory_hits']} memory hits, "
+            f"{s['disk_hits']} disk hits, {s['misses']} misses "
+            f"(hit ratio {s['hit_ratio']:.0%})"
+        )
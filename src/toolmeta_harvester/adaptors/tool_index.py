@@ -0,0 +1,75 @@
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ToolIndex:
+    """
+    Persistent index from a Toolshed tool (owner, repo, tool id, version) to
+    the GitHub folder url and XML file name it was harvested from.
+    owner and repo are the Toolshed owner and repository name taken from the
+    folder's .shed.yml.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tools (
+                owner TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                tool_id TEXT NOT NULL,
+                version TEXT NOT NULL,
+                folder_url TEXT NOT NULL,
+                xml_name TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (owner, repo, tool_id, version)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def record(self, owner, repo, folder_url, tools):
+        """tools is a list of (xml_name, ToolInfo) found in folder_url"""
+        rows = [
+            (owner, repo, tool.id, tool.version or "", folder_url, xml_name, time.time())
+            for xml_name, tool in tools
+            if tool and tool.id
+        ]
+        if not owner or not repo or not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tools "
+                "(owner, repo, tool_id, version, folder_url, xml_name, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    # Exact version first, otherwise the most recently harvested version
+    def lookup(self, owner, repo, tool_id, version):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT folder_url, xml_name FROM tools "
+                "WHERE owner = ? AND repo = ? AND tool_id = ? "
+                "ORDER BY version = ? DESC, updated_at DESC LIMIT 1",
+                (owner, repo, tool_id, version),
+            ).fetchone()
+        return row
+
+    def delete(self, owner, repo, tool_id):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM tools WHERE owner = ? AND repo = ? AND tool_id = ?",
+                (owner, repo, tool_id),
+            )
+            self._conn.commit()
@@ -0,0 +1,93 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ValidatorStore:
+    """
+    Persistent ETag/Last-Modified store for conditional GET requests.
+    The last 200 response body is kept with its validators so a 304 can be
+    answered from the store. GitHub does not count 304 responses against the
+    rate limit.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS validators (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, headers, body FROM validators "
+                "WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if not row:
+            return None
+        etag, last_modified, headers, body = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "headers": json.loads(headers),
+            "body": body,
+        }
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url, response):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        headers = {
+            k: v
+            for k, v in response.headers.items()
+            if k.lower() in {"content-type", "etag", "last-modified", "link"}
+        }
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO validators "
+                "(url, etag, last_modified, headers, body, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    etag,
+                    last_modified,
+                    json.dumps(headers),
+                    response.content,
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+
+    def delete(self, url):
+        with self._lock:
+            self._conn.execute("DELETE FROM validators WHERE url = ?", (url,))
+            self._conn.commit()
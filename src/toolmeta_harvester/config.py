@@ -1,11 +1,24 @@
 from dataclasses import dataclass
-from dynaconf import Dynaconf
+import functools
 import json
+import os
+
+
+# Dynaconf is imported, and the settings files read, on first use
+@functools.cache
+def get_settings():
+    from dynaconf import Dynaconf
+
+    return Dynaconf(
+        envvar_prefix="TOOL_REGISTRY",
+        settings_files=["config/config.toml", "config/.secrets.toml"],
+    )
 
-settings = Dynaconf(
-    envvar_prefix="TOOL_REGISTRY",
-    settings_files=["config/config.toml", "config/.secrets.toml"],
-)
+
+def __getattr__(name):
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Environment variable overrides:
 # export TOOL_REGISTRY_DATABASE__HOST=localhost
@@ -13,7 +26,14 @@ settings = Dynaconf(
 # export TOOL_REGISTRY_DATABASE__NAME=admin
 # export TOOL_REGISTRY_DATABASE__USER=harvester
 # export TOOL_REGISTRY_DATABASE__PASSWORD=yoursecretsecret
+# export TOOL_REGISTRY_DATABASE__POOL_SIZE=10
+# export TOOL_REGISTRY_DATABASE__STATEMENT_TIMEOUT=60000
 # export TOOL_REGISTRY_GITHUB__API_KEY=your_github_api_key
+# export TOOL_REGISTRY_GITHUB__API_KEYS='["token_1", "token_2"]'
+# export TOOL_REGISTRY_CRAWL__MAX_WORKERS=8
+# export TOOL_REGISTRY_CRAWL__MAX_PER_HOST=8
+# export TOOL_REGISTRY_CRAWL__MODE=archive
+# export TOOL_REGISTRY_QUEUE__LEASE_SECONDS=900
 
 
 @dataclass(frozen=True)
@@ -23,11 +43,134 @@ class DatabaseConfig:
     user: str
     password: str
     name: str
+    # Rows per INSERT ... ON CONFLICT statement
+    upsert_batch_size: int = 500
+    # Tools harvested between commits, 0 commits after every tool folder
+    commit_every: int = 0
+    # Connection pool of the lazily created engine, see db/engine.py
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_pre_ping: bool = True
+    pool_recycle: int = 1800
+    # Milliseconds before the server cancels a statement, 0 disables it
+    statement_timeout: int = 0
+    # Allow psycopg pipeline mode in db.engine.pipeline blocks
+    pipeline: bool = False
+    echo: bool = False
 
 
 @dataclass(frozen=True)
 class GitConfig:
     api_key: str
+    # All configured tokens, requests rotate across them
+    api_keys: tuple = ()
+
+
+@dataclass(frozen=True)
+class CrawlConfig:
+    # Number of threads fetching listings, tool XMLs and macros
+    max_workers: int
+    # Number of tool folders crawled at the same time
+    max_folders: int
+    # Default number of concurrent requests per host
+    max_per_host: int
+    # Per-host overrides of max_per_host, e.g. {"api.github.com": 4}
+    host_limits: dict
+    # "api" crawls the GitHub contents API, "archive" harvests from one
+    # downloaded tarball per repository
+    mode: str = "api"
+    archive_dir: str = "cache/archives"
+    # Seconds before a downloaded repository archive is fetched again
+    archive_max_age: int = 86400
+    # Requests per second per host until the host reports its rate limit
+    default_rate: float = 20.0
+    # Token bucket size, the number of requests that may be sent in a burst
+    burst: int = 20
+    # Requests kept in reserve before waiting for the rate limit reset
+    rate_limit_reserve: int = 10
+    max_retries: int = 5
+    # ETag/Last-Modified store used for conditional GitHub requests
+    validator_store: str = "cache/github_validators.sqlite"
+    # Number of parsed macro files kept in memory
+    macro_cache_size: int = 256
+    # Processes parsing tool XMLs, 0 parses in the crawl threads
+    parse_workers: int = 0
+    # Index of harvested tools used by fetch_toolshed_tool
+    tool_index: str = "cache/toolshed_tool_index.sqlite"
+    # Resolved tools shared across workflows, in memory and on disk
+    tool_cache: str = "cache/toolshed_tools.sqlite"
+    tool_cache_size: int = 1024
+    tool_cache_max_age: int = 30 * 86400
+    # Seconds a tool that was not found is not looked up again
+    tool_cache_missing_max_age: int = 86400
+    # Tool XMLs, macros and .shed.yml files by git blob sha, "" disables it
+    blob_store: str = "cache/toolshed_blobs.sqlite"
+
+
+@dataclass(frozen=True)
+class WorkflowHubConfig:
+    # Threads downloading .ga descriptors
+    download_workers: int
+    # Threads parsing workflows and resolving their toolshed tools
+    parse_workers: int
+    # Workflows written to the database per batch
+    write_batch_size: int
+    # Capacity of the queues between the stages
+    queue_size: int
+    # Refresh workflows already in the generic table instead of skipping them
+    update_existing: bool = True
+    # Threads resolving the toolshed tools of one workflow
+    workflow_tool_workers: int = 8
+
+
+@dataclass(frozen=True)
+class QueueConfig:
+    # Seconds a claimed row stays leased without a heartbeat
+    lease_seconds: int = 900
+    # Seconds between two lease extensions of a running job
+    heartbeat_interval: int = 60
+    # Claims of a row before it is left in error
+    max_attempts: int = 3
+    # Rows claimed per round trip
+    claim_batch: int = 4
+    # Seconds to wait for new work when the queue is empty
+    poll_interval: int = 30
+    # Stop the worker once nothing is left to claim
+    exit_when_idle: bool = True
+
+
+@dataclass(frozen=True)
+class HttpCacheConfig:
+    # Adaptor owning the cache, key of its [http_cache.<name>] table
+    name: str
+    # sqlite file of the cache, without the .sqlite suffix
+    path: str
+    # Default expiry in seconds, -1 never expires
+    expire_after: int = 86400
+    # Expiry per url glob pattern, first match wins. 0 expires immediately but
+    # still stores responses with validators, "do_not_cache" keeps them out.
+    urls_expire_after: dict = None
+    # Payload cap, least recently used entries are evicted above it
+    max_size_mb: int = 512
+    # Responses above this size are not cached
+    max_response_kb: int = 4096
+    excluded_content_types: tuple = ()
+    # Requests between two size checks
+    evict_interval: int = 500
+
+
+# urls_expire_after value for urls that are never written to the cache
+NOT_CACHED = "do_not_cache"
+
+# Content types never written to an HTTP cache
+DEFAULT_EXCLUDED_CONTENT_TYPES = (
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-tar",
+    "application/octet-stream",
+)
 
 
 @dataclass(frozen=True)
@@ -37,26 +180,121 @@ class GalaxyConfig:
 
 
 def load_galaxy_config() -> GitConfig:
-    galaxy = settings.galaxy_local
+    galaxy = get_settings().galaxy_local
     return GalaxyConfig(api_key=galaxy["api_key"], host_url=galaxy["host_url"])
 
 
 def load_git_config() -> GitConfig:
-    git = settings.github
+    git = get_settings().github
+    # api_keys takes a list of tokens, api_key a single token or a comma
+    # separated list
+    keys = git.get("api_keys") or git.get("api_key") or []
+    if isinstance(keys, str):
+        keys = keys.split(",")
+    keys = tuple(k.strip() for k in keys if k and k.strip())
     return GitConfig(
-        api_key=git["api_key"],
+        api_key=keys[0] if keys else "",
+        api_keys=keys,
+    )
+
+def load_crawl_config() -> CrawlConfig:
+    crawl = get_settings().get("crawl", {})
+    parse_workers = crawl.get("parse_workers", 0)
+    if parse_workers == "auto":
+        parse_workers = os.cpu_count() or 1
+    return CrawlConfig(
+        max_workers=int(crawl.get("max_workers", 8)),
+        max_folders=int(crawl.get("max_folders", 4)),
+        max_per_host=int(crawl.get("max_per_host", 8)),
+        host_limits=dict(crawl.get("host_limits", {})),
+        mode=crawl.get("mode", "api"),
+        archive_dir=crawl.get("archive_dir", "cache/archives"),
+        archive_max_age=int(crawl.get("archive_max_age", 86400)),
+        default_rate=float(crawl.get("default_rate", 20.0)),
+        burst=int(crawl.get("burst", 20)),
+        rate_limit_reserve=int(crawl.get("rate_limit_reserve", 10)),
+        max_retries=int(crawl.get("max_retries", 5)),
+        validator_store=crawl.get(
+            "validator_store", "cache/github_validators.sqlite"
+        ),
+        macro_cache_size=int(crawl.get("macro_cache_size", 256)),
+        parse_workers=int(parse_workers),
+        tool_index=crawl.get("tool_index", "cache/toolshed_tool_index.sqlite"),
+        tool_cache=crawl.get("tool_cache", "cache/toolshed_tools.sqlite"),
+        tool_cache_size=int(crawl.get("tool_cache_size", 1024)),
+        tool_cache_max_age=int(crawl.get("tool_cache_max_age", 30 * 86400)),
+        tool_cache_missing_max_age=int(
+            crawl.get("tool_cache_missing_max_age", 86400)
+        ),
+        blob_store=crawl.get("blob_store", "cache/toolshed_blobs.sqlite"),
+    )
+
+
+def load_workflow_hub_config() -> WorkflowHubConfig:
+    hub = get_settings().get("workflow_hub", {})
+    return WorkflowHubConfig(
+        download_workers=int(hub.get("download_workers", 4)),
+        parse_workers=int(hub.get("parse_workers", 4)),
+        write_batch_size=int(hub.get("write_batch_size", 50)),
+        queue_size=int(hub.get("queue_size", 32)),
+        update_existing=bool(hub.get("update_existing", True)),
+        workflow_tool_workers=int(hub.get("workflow_tool_workers", 8)),
     )
 
+
+def http_cache_names() -> list:
+    return list(get_settings().get("http_cache", {}).keys())
+
+
+def load_http_cache_config(name) -> HttpCacheConfig:
+    cache = get_settings().get("http_cache", {}).get(name, {})
+    excluded = cache.get("excluded_content_types", DEFAULT_EXCLUDED_CONTENT_TYPES)
+    return HttpCacheConfig(
+        name=name,
+        path=cache.get("path", f"cache/{name}_cache"),
+        expire_after=int(cache.get("expire_after", 86400)),
+        urls_expire_after={
+            str(pattern): ttl if ttl == NOT_CACHED else int(ttl)
+            for pattern, ttl in cache.get("urls_expire_after", {}).items()
+        },
+        max_size_mb=int(cache.get("max_size_mb", 512)),
+        max_response_kb=int(cache.get("max_response_kb", 4096)),
+        excluded_content_types=tuple(t.lower() for t in excluded),
+        evict_interval=int(cache.get("evict_interval", 500)),
+    )
+
+
+def load_queue_config() -> QueueConfig:
+    q = get_settings().get("queue", {})
+    return QueueConfig(
+        lease_seconds=int(q.get("lease_seconds", 900)),
+        heartbeat_interval=int(q.get("heartbeat_interval", 60)),
+        max_attempts=int(q.get("max_attempts", 3)),
+        claim_batch=int(q.get("claim_batch", 4)),
+        poll_interval=int(q.get("poll_interval", 30)),
+        exit_when_idle=bool(q.get("exit_when_idle", True)),
+    )
+
+
 def egi_token() -> str:
-    egi = settings.egi
+    egi = get_settings().egi
     return egi["token"]
 
 def load_db_config() -> DatabaseConfig:
-    db = settings.database
+    db = get_settings().database
     return DatabaseConfig(
         host=db["host"],
         port=db["port"],
         user=db["user"],
         password=db["password"],
         name=db["name"],
+        upsert_batch_size=int(db.get("upsert_batch_size", 500)),
+        commit_every=int(db.get("commit_every", 0)),
+        pool_size=int(db.get("pool_size", 5)),
+        max_overflow=int(db.get("max_overflow", 10)),
+        pool_pre_ping=bool(db.get("pool_pre_ping", True)),
+        pool_recycle=int(db.get("pool_recycle", 1800)),
+        statement_timeout=int(db.get("statement_timeout", 0)),
+        pipeline=bool(db.get("pipeline", False)),
+        echo=bool(db.get("echo", False)),
     )
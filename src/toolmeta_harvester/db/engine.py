@@ -1,11 +1,114 @@
+"""
+The engine is created on first use from the [database] settings, so importing
+a module that uses the database costs nothing until it connects. A forked
+child process gets a fresh engine instead of sharing the pooled connections
+of its parent. Sessions are not thread safe: every thread opens its own
+session with new_session().
+
+`from toolmeta_harvester.db.engine import engine` keeps working and returns
+the lazily created engine.
+"""
+
+import contextlib
+import os
+import threading
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
+from sqlalchemy.orm import Session, sessionmaker
 from toolmeta_harvester.config import load_db_config
 
-db = load_db_config()
+_engine = None
+_sessionmaker = None
+_lock = threading.RLock()
+
+
+def engine_url(db):
+    return URL.create(
+        "postgresql+psycopg",
+        username=db.user,
+        password=db.password,
+        host=db.host,
+        port=db.port,
+        database=db.name,
+    )
+
+
+def connect_args(db):
+    args = {}
+    if db.statement_timeout:
+        # Milliseconds, applied to every statement of every pooled connection
+        args["options"] = f"-c statement_timeout={db.statement_timeout}"
+    return args
+
+
+def create_db_engine(db=None):
+    if db is None:
+        db = load_db_config()
+    return create_engine(
+        engine_url(db),
+        echo=db.echo,
+        pool_size=db.pool_size,
+        max_overflow=db.max_overflow,
+        pool_pre_ping=db.pool_pre_ping,
+        pool_recycle=db.pool_recycle,
+        connect_args=connect_args(db),
+    )
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = create_db_engine()
+    return _engine
+
+
+def get_sessionmaker():
+    global _sessionmaker
+    if _sessionmaker is None:
+        with _lock:
+            if _sessionmaker is None:
+                _sessionmaker = sessionmaker(bind=get_engine())
+    return _sessionmaker
+
+
+def new_session() -> Session:
+    return get_sessionmaker()()
+
+
+@contextlib.contextmanager
+def pipeline(session):
+    """
+    Run the statements of the block in psycopg pipeline mode when
+    database.pipeline is enabled, saving a round trip per statement. Only
+    worth it for blocks issuing many statements whose results are not needed
+    in between.
+    """
+    if not load_db_config().pipeline:
+        yield
+        return
+    driver_connection = session.connection().connection.driver_connection
+    with driver_connection.pipeline():
+        yield
+
+
+def reset_after_fork():
+    global _engine, _sessionmaker, _lock
+    if _engine is not None:
+        # Drop the parent's pooled connections without closing them, the
+        # parent still uses the sockets
+        _engine.dispose(close=False)
+    _engine = None
+    _sessionmaker = None
+    _lock = threading.RLock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
 
-engine = create_engine(
-    f"postgresql+psycopg://{db.user}:{db.password}@{db.host}/{db.name}",
-    echo=False,
-    future=True,
-)
 
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,6 +4,8 @@ from sqlalchemy import (
     DateTime,
     Identity,
     String,
+    Index,
+    UniqueConstraint,
     func,
 )
 
@@ -12,6 +14,15 @@ import string
 import secrets
 
 
+# ToolHarvest.status values
+STATUS_PENDING = "pending"
+# Leased by a queue worker, see tasks/harvest_queue.py
+STATUS_PROCESSING = "processing"
+STATUS_PROCESSED = "processed"
+STATUS_COMPLETED = "completed"
+STATUS_ERROR = "error"
+
+
 def generate_alphanum_id(length=9):
     chars = string.ascii_lowercase + string.digits
     return "".join(secrets.choice(chars) for _ in range(length))
@@ -23,6 +34,12 @@ def generate_tool_id():
 
 class ToolHarvest(Base):
     __tablename__ = "_tool_harvest"
+    __table_args__ = (
+        UniqueConstraint(
+            "url", "artifact_type", name="uq_tool_harvest_url_artifact_type"
+        ),
+        Index("ix_tool_harvest_claim", "artifact_type", "status"),
+    )
 
     id = Column(
         Integer, Identity(start=1), autoincrement=True, primary_key=True
@@ -40,6 +57,17 @@ class ToolHarvest(Base):
     stored_id = Column(String)
     # name of the corresponding table where the artifact is stored
     stored_table = Column(String)
+    # worker holding the row while it is processing, until lease_expires_at
+    lease_owner = Column(String)
+    lease_expires_at = Column(DateTime(timezone=True))
+    heartbeat_at = Column(DateTime(timezone=True))
+    # number of times a worker claimed the row
+    attempts = Column(Integer, server_default="0", nullable=False)
+    # git tree sha of a tool folder as of the last harvest, see
+    # galaxy_toolshed.get_tool_folder_shas
+    tree_sha = Column(String)
+    # commit at the head of a repository as of the last harvest
+    head_commit = Column(String)
     created_at = Column(
         DateTime(timezone=True),
         server_default=func.now(),
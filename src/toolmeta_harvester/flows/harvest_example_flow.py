@@ -2,16 +2,12 @@ import logging
 import requests
 from toolmeta_harvester import config
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s %(name)s %(levelname)s: %(message)s",
-)
 logger = logging.getLogger(__name__)
 
 # Important: Ensure ending forward slash in API_URL for correct endpoint construction in post_json_to_registry
 API_URL = "https://dev.tools-registry.eosc-data-commons.eu/api/v1/tools/"
-# Get your token from egi https://aai.egi.eu/token/ and set it in the config file or environment variable as needed
-TOKEN = config.egi_token()
+# Get your token from egi https://aai.egi.eu/token/ and set it in the config file or environment variable as needed.
+# It is read by main(), importing this module does not need it.
 
 
 def get_tool_metadata():
@@ -84,6 +80,12 @@ def post_json_to_registry(data, api_url, token=None, timeout=10):
         }
 
 def main():
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+    )
+    token = config.egi_token()
+
     # Step 1: Fetch and process tool metadata from the source provider
     logger.info("Fetching tool metadata from source provider...")
     tools = get_tool_metadata()
@@ -91,7 +93,7 @@ def main():
     # Step 2: Post each tool metadata to the registry
     logger.info(f"Posting {len(tools)} tools to the registry...")
     for tool in tools:
-        response = post_json_to_registry(tool, API_URL, TOKEN)
+        response = post_json_to_registry(tool, API_URL, token)
         if response.get("success"):
             logger.info(f"Successfully posted {tool['name']} version {tool['version']} to registry")
             logger.debug(f"Response: {response}")
@@ -1,61 +1,65 @@
 import logging
 from pathlib import Path
 from toolmeta_harvester.tasks import galaxy_harvest_tasks as ght
-from toolmeta_harvester.adaptors import galaxy_workflow_hub as gwh
+from toolmeta_harvester.tasks import workflow_hub_pipeline as hub_pipeline
+from toolmeta_harvester.adaptors import galaxy_toolshed as shed
 
 LOG_FILE = Path("logs/harvest_galaxy_hub_workflows.log")
-# Create directory if it does not exist
-LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(name)s %(levelname)s: %(message)s",
-    handlers=[logging.StreamHandler(),
-              logging.FileHandler(LOG_FILE)],
-)
 
 logger = logging.getLogger(__name__)
 
 
+# Logging is configured when the flow runs, importing the module has no side
+# effects
+def setup_logging():
+    # Create directory if it does not exist
+    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+        handlers=[logging.StreamHandler(),
+                  logging.FileHandler(LOG_FILE)],
+    )
+
+
+def log_workflow_info(workflow_info):
+    logger.info(f"Workflow UUID: {workflow_info.uuid}")
+    logger.info(f"Name: {workflow_info.name}")
+    logger.info(f"Version: {workflow_info.version}")
+    # logger.info(f"Description: {workflow_info.description}")
+    logger.info(f"Tags: {', '.join(workflow_info.tags)}")
+    logger.info(f"URL: {workflow_info.url}")
+    logger.info(f"Input data types: {len(workflow_info.inputs)}")
+    logger.info(f"Output data types: {len(workflow_info.outputs)}")
+    logger.debug(f"Toolshed tools used: {
+                len(workflow_info.toolshed_tools)}")
+    logger.debug(workflow_info.toolshed_tools)
+    logger.info("Added workflow and tools to the database.")
+    logger.info("-" * 40)
+
+
 def pipeline_harvest_workflow_hub(no_of_workflows: int = 10):
     # Step 1: Initialize DB
     ght.create_tables()
     session = ght.get_db_session()
     logger.info("Database tables created.")
 
-    # Step 2: Crawl Galaxy Workflow Hub
-    # Get first n workflows from Galaxy Workflow Hub
-    number_of_wf_to_harvest = 0
-    # Iterate through Galaxy Workflow Hub workflows and print their metadata
-    for workflow_info in gwh.iter_workflows():
-        logger.info(f"Workflow UUID: {workflow_info.uuid}")
-        logger.info(f"Name: {workflow_info.name}")
-        logger.info(f"Version: {workflow_info.version}")
-        # logger.info(f"Description: {workflow_info.description}")
-        logger.info(f"Tags: {', '.join(workflow_info.tags)}")
-        logger.info(f"URL: {workflow_info.url}")
-        logger.info(f"Input data types: {len(workflow_info.inputs)}")
-        logger.info(f"Output data types: {len(workflow_info.outputs)}")
-        logger.debug(f"Toolshed tools used: {
-                    len(workflow_info.toolshed_tools)}")
-        logger.debug(workflow_info.toolshed_tools)
-        logger.info("-" * 40)
-
-        # Step 3: Store Galaxy Workflow in DB
-        # ght.add_workflow_to_db(workflow_info, session)
-        ght.add_workflow_to_generic_table(workflow_info, session)
-        logger.info("Added workflow and tools to the database.")
+    # Step 2: Crawl Galaxy Workflow Hub and store the workflows in the DB.
+    # Downloading, parsing and writing run as overlapping stages, see
+    # [workflow_hub] in config.toml for the parallelism of each stage.
+    number_of_wf_harvested = hub_pipeline.harvest_workflow_hub(
+        session, no_of_workflows, on_written=log_workflow_info
+    )
+    logger.info(
+        f"Harvested {
+            number_of_wf_harvested
+        } workflows from Galaxy Workflow Hub."
+    )
+    shed.tool_cache().log_stats()
 
-        number_of_wf_to_harvest += 1
-        if number_of_wf_to_harvest == no_of_workflows:
-            logger.info(
-                f"Harvested {
-                    number_of_wf_to_harvest
-                } workflows from Galaxy Workflow Hub. Stopping harvest."
-            )
-            break
 
 def main():
+    setup_logging()
     logger.info("Starting Galaxy Hub workflow harvesting process.")
     pipeline_harvest_workflow_hub(5)
 
@@ -0,0 +1,67 @@
+import argparse
+import logging
+import signal
+import threading
+from pathlib import Path
+from toolmeta_harvester.tasks import galaxy_harvest_tasks as ght
+from toolmeta_harvester.db.engine import new_session
+from toolmeta_harvester.tasks import harvest_queue
+
+LOG_FILE = Path("logs/harvest_toolshed_worker.log")
+
+logger = logging.getLogger(__name__)
+
+
+# Logging is configured when the flow runs, importing the module has no side
+# effects
+def setup_logging():
+    # Create directory if it does not exist
+    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+        handlers=[logging.StreamHandler(),
+                  logging.FileHandler(LOG_FILE)],
+    )
+
+
+def harvest_toolshed_worker(max_jobs=None, requeue=False):
+    # Step 1: Register the toolshed repositories. Rows that already exist keep
+    # their status, so every worker can run this safely.
+    ght.populate_harvests_table_with_shed_tools()
+
+    # Step 1b: On a scheduled re-harvest, run by a single process before the
+    # workers, queue every repository again. Only repositories with new
+    # commits and tool folders with a new tree sha are crawled.
+    if requeue:
+        with new_session() as session:
+            requeued = harvest_queue.requeue(session)
+        logger.info(f"Requeued {requeued} harvest targets.")
+
+    # Step 2: Claim and process repository and tool folder jobs until the
+    # queue is empty. Start as many workers as needed, on as many nodes as
+    # needed, see [queue] in config.toml for leases and retries.
+    stop = threading.Event()
+    # Finish the running job on SIGTERM/SIGINT and hand back the rest
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    completed = harvest_queue.run_worker(max_jobs=max_jobs, stop=stop)
+    logger.info(f"Completed {completed} toolshed harvest jobs.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Toolshed harvest worker")
+    parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="queue all repositories again for an incremental re-harvest",
+    )
+    parser.add_argument("--max-jobs", type=int, help="stop after this many jobs")
+    args = parser.parse_args()
+    setup_logging()
+    logger.info("Starting toolshed harvest worker.")
+    harvest_toolshed_worker(max_jobs=args.max_jobs, requeue=args.requeue)
+
+
+if __name__ == "__main__":
+    main()
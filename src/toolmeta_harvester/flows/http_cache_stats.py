@@ -0,0 +1,46 @@
+import argparse
+import logging
+from toolmeta_harvester import config
+from toolmeta_harvester.adaptors.http_cache import cached_session
+
+logger = logging.getLogger(__name__)
+
+
+def log_cache_stats(stats):
+    logger.info(f"HTTP cache {stats['name']} ({stats['path']})")
+    logger.info(f"  Entries: {stats['entries']} ({stats['expired']} expired)")
+    logger.info(
+        f"  Payload: {stats['payload_bytes'] / 2**20:.1f} MB of "
+        f"{stats['max_bytes'] / 2**20:.0f} MB, file {stats['file_bytes'] / 2**20:.1f} MB"
+    )
+    logger.info(
+        f"  Hits: {stats['hits']}, misses: {stats['misses']}, "
+        f"hit ratio: {stats['hit_ratio']:.1%}, evicted: {stats['evicted']}"
+    )
+
+
+def http_cache_stats(names=None, evict=False):
+    for name in names or config.http_cache_names():
+        session = cached_session(name)
+        try:
+            if evict:
+                # Expired and over the cap entries, then compact the file
+                session.evict(vacuum=True)
+            log_cache_stats(session.stats())
+        finally:
+            session.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Report the adaptor HTTP caches")
+    parser.add_argument("names", nargs="*", help="caches to report, all by default")
+    parser.add_argument(
+        "--evict", action="store_true", help="evict and compact before reporting"
+    )
+    args = parser.parse_args()
+    http_cache_stats(args.names, args.evict)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import logging
+from toolmeta_harvester.config import load_crawl_config
+from toolmeta_harvester.adaptors.blob_store import BlobStore
+
+logger = logging.getLogger(__name__)
+
+
+def log_blob_stats(stats):
+    logger.info(f"Blob store {stats['path']}")
+    logger.info(f"  Blobs: {stats['blobs']}, listed by {stats['folders']} tool folders")
+    logger.info(
+        f"  Size: {stats['size_bytes'] / 2**20:.1f} MB, "
+        f"stored {stats['stored_bytes'] / 2**20:.1f} MB compressed"
+    )
+
+
+# Drop the blobs of files no harvested tool folder lists any more. A folder's
+# listing is replaced every time the folder is crawled, so blobs of files
+# that changed or were removed become garbage after the re-harvest.
+def toolshed_blob_gc(path=None, vacuum=False):
+    if path is None:
+        path = load_crawl_config().blob_store
+    if not path:
+        logger.info("The blob store is disabled, see [crawl] blob_store.")
+        return 0
+    store = BlobStore(path)
+    try:
+        removed, freed = store.gc(vacuum=vacuum)
+        logger.info(f"Removed {removed} blobs, {freed / 2**20:.1f} MB.")
+        log_blob_stats(store.stats())
+    finally:
+        store.close()
+    return removed
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(
+        description="Remove unreferenced blobs from the toolshed blob store"
+    )
+    parser.add_argument("--path", help="blob store file, [crawl] blob_store by default")
+    parser.add_argument(
+        "--vacuum", action="store_true", help="compact the file after removing"
+    )
+    args = parser.parse_args()
+    toolshed_blob_gc(args.path, args.vacuum)
+
+
+if __name__ == "__main__":
+    main()
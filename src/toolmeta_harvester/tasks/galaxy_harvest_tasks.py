@@ -1,7 +1,13 @@
 import logging
 import json
-from toolmeta_harvester.db.engine import engine
+from dataclasses import asdict, dataclass
+from toolmeta_harvester.db.engine import get_engine, new_session
 from toolmeta_harvester.db.models import (
+    STATUS_COMPLETED,
+    STATUS_ERROR,
+    STATUS_PENDING,
+    STATUS_PROCESSED,
+    STATUS_PROCESSING,
     Base,
     ToolHarvest,
 )
@@ -19,30 +25,209 @@ from toolmeta_harvester.adaptors import galaxy_toolshed
 from requests.exceptions import HTTPError
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select
+from sqlalchemy import (
+    JSON,
+    and_,
+    bindparam,
+    case,
+    cast,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from toolmeta_harvester.config import load_db_config
 
 logger = logging.getLogger(__name__)
 
+# ToolHarvest.artifact_type of toolshed repositories and of their tool folders
+SHED_REPOSITORY = "galaxy_shed_tool"
+SHED_TOOL_FOLDER = "galaxy_shed_tool_folder"
+
 
 def create_tables():
     """Create all tables in the database."""
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(get_engine())
 
 
 def populate_harvests_table_with_shed_tools():
     """Populate the repository table with initial data."""
     galaxy_repos = galaxy_toolshed.get_unique_repositories()
-    with Session(engine) as session:
-        session.add_all(
-            ToolHarvest(
-                url=u,
-                status="pending",
-                artifact_type="galaxy_shed_tool",
-                source_type="toolshed.g2.bx.psu.edu",
+    with new_session() as session:
+        added = sync_harvest_targets(galaxy_repos, session)
+        session.commit()
+    logger.info(f"Added {added} of {len(galaxy_repos)} toolshed repositories")
+
+
+def sync_harvest_targets(
+    urls,
+    session,
+    artifact_type=SHED_REPOSITORY,
+    source_type="toolshed.g2.bx.psu.edu",
+    batch_size=None,
+):
+    """
+    Register harvest targets with INSERT ... ON CONFLICT (url, artifact_type)
+    DO NOTHING, so known urls keep their status. The caller commits.
+    Returns the number of newly added urls.
+    """
+    if batch_size is None:
+        batch_size = load_db_config().upsert_batch_size
+    urls = list(dict.fromkeys(urls))
+    added = 0
+    for start in range(0, len(urls), batch_size):
+        stmt = (
+            pg_insert(ToolHarvest)
+            .values(
+                [
+                    dict(
+                        url=url,
+                        status=STATUS_PENDING,
+                        artifact_type=artifact_type,
+                        source_type=source_type,
+                    )
+                    for url in urls[start : start + batch_size]
+                ]
+            )
+            .on_conflict_do_nothing(
+                index_elements=[ToolHarvest.url, ToolHarvest.artifact_type]
             )
-            for u in galaxy_repos
+            .returning(ToolHarvest.id)
         )
-        session.commit()
+        added += len(session.execute(stmt).all())
+    return added
+
+
+@dataclass(frozen=True)
+class HarvestState:
+    status: str
+    tree_sha: str = None
+    head_commit: str = None
+
+
+def load_harvest_states(session, urls=None, artifact_type=SHED_REPOSITORY):
+    """
+    url -> HarvestState map of the harvest targets, all of them or only the
+    given urls, in one query.
+    """
+    stmt = select(
+        ToolHarvest.url,
+        ToolHarvest.status,
+        ToolHarvest.tree_sha,
+        ToolHarvest.head_commit,
+    ).where(ToolHarvest.artifact_type == artifact_type)
+    if urls is not None:
+        urls = list(urls)
+        if not urls:
+            return {}
+        stmt = stmt.where(ToolHarvest.url.in_(urls))
+    return {url: HarvestState(*state) for url, *state in session.execute(stmt)}
+
+
+DONE_STATUSES = (STATUS_PROCESSED, STATUS_COMPLETED)
+
+
+# Whether the tool folder was harvested at tree_sha, so crawling it again
+# would store the same tools. Folders harvested before tree shas were
+# recorded count as unchanged and adopt the current sha.
+def is_unchanged(state, tree_sha):
+    return (
+        state is not None
+        and tree_sha is not None
+        and state.tree_sha in (tree_sha, None)
+        and state.status in DONE_STATUSES
+    )
+
+
+# changes maps url -> (status, tree_sha)
+def update_harvest_statuses(changes, session, artifact_type=SHED_REPOSITORY):
+    if not changes:
+        return
+    table = ToolHarvest.__table__
+    session.execute(
+        update(table)
+        .where(table.c.url == bindparam("b_url"))
+        .where(table.c.artifact_type == artifact_type)
+        .values(
+            status=bindparam("b_status"),
+            tree_sha=bindparam("b_tree_sha"),
+            updated_at=func.now(),
+        ),
+        [
+            dict(b_url=url, b_status=status, b_tree_sha=tree_sha)
+            for url, (status, tree_sha) in changes.items()
+        ],
+    )
+
+
+def sync_tool_folders(folder_shas, session, batch_size=None):
+    """
+    Queue the tool folders of a repository from its folder url -> tree sha
+    map. New folders are added as pending, known folders go back to pending
+    only when their tree sha changed, except while a worker holds them.
+    Folders harvested before tree shas were recorded keep their status and
+    adopt the sha. The caller commits. Returns the number of folders added
+    and requeued.
+    """
+    if batch_size is None:
+        batch_size = load_db_config().upsert_batch_size
+    items = list(folder_shas.items())
+    added = requeued = 0
+    for start in range(0, len(items), batch_size):
+        stmt = pg_insert(ToolHarvest).values(
+            [
+                dict(
+                    url=url,
+                    status=STATUS_PENDING,
+                    artifact_type=SHED_TOOL_FOLDER,
+                    source_type="toolshed.g2.bx.psu.edu",
+                    tree_sha=tree_sha,
+                )
+                for url, tree_sha in items[start : start + batch_size]
+            ]
+        )
+        legacy = and_(
+            ToolHarvest.tree_sha.is_(None), ToolHarvest.status.in_(DONE_STATUSES)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ToolHarvest.url, ToolHarvest.artifact_type],
+            set_=dict(
+                status=case((legacy, ToolHarvest.status), else_=STATUS_PENDING),
+                tree_sha=stmt.excluded.tree_sha,
+                attempts=case((legacy, ToolHarvest.attempts), else_=0),
+                eror_code=case((legacy, ToolHarvest.eror_code), else_=None),
+                updated_at=func.now(),
+            ),
+            where=and_(
+                ToolHarvest.tree_sha.is_distinct_from(stmt.excluded.tree_sha),
+                ToolHarvest.status != STATUS_PROCESSING,
+            ),
+        ).returning(literal_column("xmax = 0"), ToolHarvest.status)
+        for inserted, status in session.execute(stmt):
+            if inserted:
+                added += 1
+            elif status == STATUS_PENDING:
+                requeued += 1
+    return added, requeued
+
+
+# Record the head commit a repository was harvested at, registering the
+# repository when it is not a harvest target yet. The caller commits.
+def mark_repository_harvested(repo_url, head_commit, session):
+    sync_harvest_targets([repo_url], session)
+    session.execute(
+        update(ToolHarvest)
+        .where(ToolHarvest.url == repo_url)
+        .where(ToolHarvest.artifact_type == SHED_REPOSITORY)
+        .values(
+            status=STATUS_PROCESSED,
+            head_commit=head_commit,
+            updated_at=func.now(),
+        )
+    )
 
 
 # def get_tools_from_db():
@@ -55,7 +240,7 @@ def populate_harvests_table_with_shed_tools():
 
 def get_error_repositories():
     """Process repositories with error status."""
-    with Session(engine) as session:
+    with new_session() as session:
         error_repos = (
             session.query(ToolHarvest)
             .filter_by(status="error")
@@ -67,7 +252,7 @@ def get_error_repositories():
 
 def get_all_repositories():
     """Process repositories with error status."""
-    with Session(engine) as session:
+    with new_session() as session:
         error_repos = (
             session.query(ToolHarvest).filter_by(
                 artifact_type="galaxy_shed_tool").all()
@@ -76,47 +261,119 @@ def get_all_repositories():
             logger.debug(f"Repository: {repo.url} with status: {repo.status}")
 
 
-def process_single_repository(repo_url, session):
-    # tools = galaxy_toolshed.smart_crawl_repository(repo_url)
-    # print(f"Processing repository: {repo_url} with {len(tools)} tools found.")
-    tool_folders = galaxy_toolshed.get_tool_folders(repo_url)
-    for url in tool_folders:
-        results = session.query(ToolHarvest).filter_by(url=url).all()
-        repo = None
-        if len(results) > 0:
-            repo = results[0]
-            if repo.status == "completed":
-                logger.debug(
-                    f"Repository {
-                        url} already exists in the database. Skipping."
-                )
-                continue
-        else:
-            repo = ToolHarvest(
-                url=url, status="pending", artifact_type="galaxy_shed_tool"
-            )
-            session.add(repo)
-            session.commit()
-            session.flush()
-        try:
-            tools = galaxy_toolshed.crawl_repository(url)
+def tool_formats(params):
+    results = set()
+    for param in params:
+        results.update(split_formats(param.get("format")))
+    return list(results)
 
-            for tool in tools:
-                add_tool_to_db(tool, session)
-                repo.status = "processed"
-                session.commit()
-                session.flush()
 
+def tool_generic_row(tool):
+    return dict(
+        uri=tool.uri,
+        name=tool.tool_name,
+        description=tool.description,
+        version=tool.version,
+        archetype=tool.tool_type,
+        input_file_formats=tool_formats(tool.inputs),
+        output_file_formats=tool_formats(tool.outputs),
+        location=tool.repo_url,
+        raw_metadata=asdict(tool),
+        metadata_schema={},
+        metadata_type="galaxy_tool_xml",
+        metadata_version=tool.version,
+        created_by="admin",
+    )
+
+
+def add_tools_to_db(tools, session):
+    """
+    Upsert the tools of a folder into the generic table. The caller owns the
+    transaction.
+    """
+    rows = {}
+    for tool in tools:
+        if not tool.uri:
+            logger.warning(
+                f"Skipping tool {tool.id or tool.tool_name} in {tool.repo_url}: "
+                "no tool id or .shed.yml owner/name to build its uri from"
+            )
+            continue
+        rows[tool.uri] = tool_generic_row(tool)
+    if rows:
+        upsert_generic_rows(list(rows.values()), session)
+    return len(rows)
+
+
+def process_single_repository(repo_url, session, commit_every=None, states=None):
+    """
+    Harvest every tool folder of a repository as one unit of work. Each folder
+    is written inside a savepoint so a failing folder only rolls back itself.
+    Commits happen once per folder, or once every commit_every tools when set.
+    states is the url -> state map of the run (see load_harvest_states), it is
+    loaded for the repository folders when not given and kept up to date.
+
+    Harvesting is incremental: a repository whose head commit did not move
+    since it was last harvested is skipped without reading its tree, and only
+    tool folders whose git tree sha changed are crawled again.
+    """
+    if commit_every is None:
+        commit_every = load_db_config().commit_every
+    branch, head_commit = galaxy_toolshed.get_repo_head(repo_url)
+    repo_state = load_harvest_states(session, [repo_url]).get(repo_url)
+    if (
+        repo_state is not None
+        and repo_state.head_commit == head_commit
+        and repo_state.status in DONE_STATUSES
+    ):
+        logger.debug(f"Repository {repo_url} unchanged at {head_commit}. Skipping.")
+        return
+    folder_shas = galaxy_toolshed.get_tool_folder_shas(
+        repo_url, branch, head_commit
+    )
+    if states is None:
+        states = load_harvest_states(session, folder_shas, SHED_TOOL_FOLDER)
+    new_folders = [url for url in folder_shas if url not in states]
+    sync_harvest_targets(new_folders, session, artifact_type=SHED_TOOL_FOLDER)
+
+    changed = {}
+    failed = 0
+    uncommitted = 0
+    for url, tree_sha in folder_shas.items():
+        state = states.get(url)
+        if is_unchanged(state, tree_sha):
+            logger.debug(f"Tool folder {url} unchanged at {tree_sha}. Skipping.")
+            if state.tree_sha is None:
+                changed[url] = (state.status, tree_sha)
+            continue
+        try:
+            tools = galaxy_toolshed.crawl_tool_folder(url)
+            with session.begin_nested():
+                uncommitted += add_tools_to_db(tools, session)
+            changed[url] = (STATUS_PROCESSED, tree_sha)
         except Exception as e:
             logger.error(f"Error processing repository {url}: {e}")
-            repo.status = "error"
+            changed[url] = (STATUS_ERROR, tree_sha)
+            failed += 1
+        if commit_every <= 0 or uncommitted >= commit_every:
+            update_harvest_statuses(changed, session, SHED_TOOL_FOLDER)
             session.commit()
-            session.flush()
-            continue
+            states.update(
+                (url, HarvestState(*change)) for url, change in changed.items()
+            )
+            changed = {}
+            uncommitted = 0
+    update_harvest_statuses(changed, session, SHED_TOOL_FOLDER)
+    # Failed folders are retried on the next run, which only happens when the
+    # head commit is not recorded
+    if not failed:
+        mark_repository_harvested(repo_url, head_commit, session)
+    session.commit()
+    states.update((url, HarvestState(*change)) for url, change in changed.items())
 
 
 def get_db_session():
-    return Session(engine)
+    return new_session()
 
 
 def get_input_formats(wf):
@@ -139,130 +396,225 @@ def get_output_formats(wf):
                 results.add(fmt.strip())
     return list(results)
 
-def add_workflow_to_generic_table(wf, session):
-    if not session:
-        session = Session(engine)
-    try:
-        existing = session.execute(
-            select(ToolGeneric).where(ToolGeneric.uri == wf.url)
-        ).scalar_one_or_none()
-
-        if existing:
-            logger.info(f"Workflow with URL {wf.url} already exists in generic table. Skipping insert.")
-            return existing  # Already in DB → return it
-
-        wf_generic = ToolGeneric(
-            uri=wf.url,
-            name=wf.name,
-            description=wf.description,
-            version=wf.version,
-            archetype="galaxy_workflow",
-            input_file_formats=get_input_formats(wf),
-            output_file_formats=get_output_formats(wf),
-            location=wf.url,
-            raw_metadata=wf.raw_ga,
-            metadata_schema={},
-            metadata_type="a_galaxy_workflow",
-            metadata_version=wf.raw_ga.get("format-version", "unknown"),
-            created_by="admin",
-        )
-        session.add(wf_generic)
-        session.commit()
-        session.flush()
-        return wf_generic
-    except IntegrityError as e:
-        logger.warning(f"IntegrityError for workflow tool {wf.url}: {e}")
-        session.rollback()
-        return None
-    except Exception as e:
-        logger.error(f"Error adding workflow {wf.url} to generic table: {e}")
-        session.rollback()
-        raise 
-
-def add_workflow_to_db(wf, session):
-    if not session:
-        session = Session(engine)
-    try:
-        db_wf = ToolArtifact(
-            id=wf.uuid,
-            name=wf.name,
-            version=wf.version,
-            archetype="galaxy_workflow",
-            location=wf.url,
-            raw_metadata=json.dumps(wf.raw_ga),
-            metadata_type="a_galaxy_workflow",
-            metadata_version=wf.raw_ga.get("format-version", "unknown"),
-        )
-
-        session.add(db_wf)
-
-        db_contract = ToolContract(
-            description=wf.description,
-            contract_version="0.1",
-        )
-
-        session.add(db_contract)
-        session.flush()  # Ensure db_contract.id is populated
-
-        db_implementation = ToolImplementation(
-            contract_id=db_contract.id,
-            artifact_id=db_wf.id,
-        )
+def workflow_generic_row(wf):
+    return dict(
+        uri=wf.url,
+        name=wf.name,
+        description=wf.description,
+        version=wf.version,
+        archetype="galaxy_workflow",
+        input_file_formats=get_input_formats(wf),
+        output_file_formats=get_output_formats(wf),
+        location=wf.url,
+        raw_metadata=wf.raw_ga,
+        metadata_schema={},
+        metadata_type="a_galaxy_workflow",
+        metadata_version=wf.raw_ga.get("format-version", "unknown"),
+        created_by="admin",
+    )
+
+
+# Columns refreshed when a harvested workflow already exists
+GENERIC_UPDATE_COLUMNS = (
+    "name",
+    "description",
+    "version",
+    "archetype",
+    "input_file_formats",
+    "output_file_formats",
+    "location",
+    "raw_metadata",
+    "metadata_schema",
+    "metadata_type",
+    "metadata_version",
+)
 
-        session.add(db_implementation)
 
-        for tool in wf.input_tools:
-            for input in tool.inputs:
-                logger.debug(f"Processing input: {input}")
-                input_kind = {"param": "parameter", "data": "data"}.get(
-                    input.get("tag", ""), ""
+# json has no equality operator in postgres, compare those columns as jsonb
+def comparable(column):
+    if isinstance(column.type, JSON):
+        return cast(column, JSONB)
+    return column
+
+
+def upsert_generic_rows(rows, session, update=True):
+    stmt = pg_insert(ToolGeneric).values(rows)
+    if update:
+        table = ToolGeneric.__table__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ToolGeneric.uri],
+            set_={name: stmt.excluded[name] for name in GENERIC_UPDATE_COLUMNS},
+            # Rows whose content did not change are left untouched
+            where=or_(
+                *(
+                    comparable(table.c[name]).is_distinct_from(
+                        comparable(stmt.excluded[name])
+                    )
+                    for name in GENERIC_UPDATE_COLUMNS
                 )
-                db_input = ToolInput(
-                    contract_id=db_contract.id,
+            ),
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[ToolGeneric.uri])
+    # xmax is 0 only for tuples created by this statement
+    stmt = stmt.returning(ToolGeneric.uri, literal_column("xmax = 0"))
+    return session.execute(stmt).all()
+
+
+def upsert_workflows_to_generic_table(wfs, session=None, batch_size=None, update=True):
+    """
+    Store workflows in the generic table with INSERT ... ON CONFLICT (uri),
+    one statement and one commit per batch. With update=False existing rows
+    are kept as they are (DO NOTHING).
+    Returns a dict with the inserted, updated and unchanged uris.
+    """
+    if not session:
+        session = new_session()
+    if batch_size is None:
+        batch_size = load_db_config().upsert_batch_size
+    outcome = {"inserted": [], "updated": [], "unchanged": []}
+    wfs = list(wfs)
+    for start in range(0, len(wfs), batch_size):
+        # A statement cannot touch the same row twice, keep the last duplicate
+        rows = {wf.url: workflow_generic_row(wf) for wf in wfs[start : start + batch_size]}
+        try:
+            returned = upsert_generic_rows(list(rows.values()), session, update)
+            session.commit()
+        except Exception as e:
+            logger.error(f"Error upserting {len(rows)} workflows to generic table: {e}")
+            session.rollback()
+            raise
+        touched = set()
+        for uri, inserted in returned:
+            outcome["inserted" if inserted else "updated"].append(uri)
+            touched.add(uri)
+        outcome["unchanged"].extend(uri for uri in rows if uri not in touched)
+    logger.info(
+        f"Generic table upsert: {len(outcome['inserted'])} inserted, "
+        f"{len(outcome['updated'])} updated, {len(outcome['unchanged'])} unchanged"
+    )
+    return outcome
+
+
+def add_workflow_to_generic_table(wf, session, update=False):
+    outcome = upsert_workflows_to_generic_table([wf], session, update=update)
+    if outcome["unchanged"]:
+        logger.info(f"Workflow with URL {wf.url} already exists in generic table.")
+    return outcome
+
+
+def split_formats(value):
+    return [fmt.strip() for fmt in value.split(",")] if value else []
+
+
+def workflow_artifact_row(wf):
+    return dict(
+        id=wf.uuid,
+        name=wf.name,
+        version=wf.version,
+        archetype="galaxy_workflow",
+        location=wf.url,
+        raw_metadata=json.dumps(wf.raw_ga),
+        metadata_type="a_galaxy_workflow",
+        metadata_version=wf.raw_ga.get("format-version", "unknown"),
+    )
+
+
+def workflow_io_rows(wf, contract_id):
+    input_rows = []
+    output_rows = []
+    for tool in wf.input_tools:
+        for input in tool.inputs:
+            input_kind = {"param": "parameter", "data": "data"}.get(
+                input.get("tag", ""), ""
+            )
+            input_rows.append(
+                dict(
+                    contract_id=contract_id,
                     name=input.get("name", ""),
                     role=input.get("tag", ""),
                     input_kind=input_kind,
                     type=input.get("type", ""),
                     # modality=input.get("type", ""),
                     description=input.get("label", ""),
-                    encoding_formats=[],
+                    encoding_formats=split_formats(input.get("format")),
                 )
-                formats = input.get("format").split(
-                    ",") if input.get("format") else []
-                for fmt in formats:
-                    db_input.encoding_formats.append(fmt.strip())
-                session.add(db_input)
-
-            for output in tool.outputs:
-                db_output = ToolOutput(
-                    contract_id=db_contract.id,
+            )
+
+        for output in tool.outputs:
+            output_rows.append(
+                dict(
+                    contract_id=contract_id,
                     name=output.get("name", ""),
                     # role=output.get("tag", ""),
                     # modality=output.get("type", ""),
                     type=output.get("type", ""),
                     description=output.get("label", ""),
-                    encoding_formats=[],
+                    encoding_formats=split_formats(output.get("format")),
                 )
-                formats = (
-                    output.get("format").split(
-                        ",") if output.get("format") else []
-                )
-                for fmt in formats:
-                    db_output.encoding_formats.append(fmt.strip())
-
-                session.add(db_output)
-
-        session.flush()
-        logger.info(
-            f"Adding workflow: {db_wf.id}, {
-                db_wf.name}, version: {db_wf.version}"
-        )
-
+            )
+    return input_rows, output_rows
+
+
+def insert_workflows(wfs, session):
+    """
+    Write artifacts, contracts, implementations, inputs and outputs of a
+    batch of workflows with one multi-row INSERT per table. The caller owns
+    the transaction.
+    """
+    session.execute(insert(ToolArtifact), [workflow_artifact_row(wf) for wf in wfs])
+    contract_ids = session.scalars(
+        insert(ToolContract).returning(
+            ToolContract.id, sort_by_parameter_order=True
+        ),
+        [dict(description=wf.description, contract_version="0.1") for wf in wfs],
+    ).all()
+    session.execute(
+        insert(ToolImplementation),
+        [
+            dict(contract_id=contract_id, artifact_id=wf.uuid)
+            for wf, contract_id in zip(wfs, contract_ids)
+        ],
+    )
+    input_rows = []
+    output_rows = []
+    for wf, contract_id in zip(wfs, contract_ids):
+        inputs, outputs = workflow_io_rows(wf, contract_id)
+        input_rows.extend(inputs)
+        output_rows.extend(outputs)
+    if input_rows:
+        session.execute(insert(ToolInput), input_rows)
+    if output_rows:
+        session.execute(insert(ToolOutput), output_rows)
+
+
+def add_workflows_to_db(wfs, session=None):
+    """
+    Bulk version of add_workflow_to_db, one transaction per batch. When the
+    batch hits an IntegrityError the workflows are retried one by one, so a
+    duplicate only drops itself. Returns the number of workflows stored.
+    """
+    if not session:
+        session = new_session()
+    wfs = list(wfs)
+    if not wfs:
+        return 0
+    try:
+        insert_workflows(wfs, session)
         session.commit()
-        session.flush()
+        logger.info(f"Added {len(wfs)} workflows")
+        return len(wfs)
     except IntegrityError as e:
-        logger.error(f"IntegrityError for workflow tool {db_wf.id}: {e}")
         session.rollback()
+        if len(wfs) == 1:
+            logger.error(f"IntegrityError for workflow tool {wfs[0].uuid}: {e}")
+            return 0
+    return sum(add_workflows_to_db([wf], session) for wf in wfs)
+
+
+def add_workflow_to_db(wf, session):
+    logger.info(f"Adding workflow: {wf.uuid}, {wf.name}, version: {wf.version}")
+    add_workflows_to_db([wf], session)
 
 
 # def add_tool_to_db(tool, session):
@@ -0,0 +1,365 @@
+"""
+Lease based work queue over _tool_harvest. Any number of workers, on any
+number of nodes, claim rows with SELECT ... FOR UPDATE SKIP LOCKED. A claimed
+row is leased to its worker until lease_expires_at and the worker keeps the
+lease alive with heartbeats. A row whose lease expired, because its worker
+died, is claimed again by another worker. Failed rows go back to pending
+until they were claimed max_attempts times.
+
+Toolshed repositories are split into jobs per tool folder: a repository job
+registers its tool folders as new rows, which are then spread over the
+workers. Re-harvests are incremental, see requeue: a repository job whose
+head commit did not move finishes without reading the tree, otherwise only
+tool folders whose git tree sha changed are queued again.
+"""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from sqlalchemy import and_, case, func, or_, select, update
+from toolmeta_harvester.config import load_queue_config
+from toolmeta_harvester.db.engine import new_session, pipeline
+from toolmeta_harvester.db.models import (
+    STATUS_COMPLETED,
+    STATUS_ERROR,
+    STATUS_PENDING,
+    STATUS_PROCESSING,
+    ToolHarvest,
+)
+from toolmeta_harvester.adaptors import galaxy_toolshed
+from toolmeta_harvester.tasks import galaxy_harvest_tasks as ght
+
+logger = logging.getLogger(__name__)
+
+HARVEST_TABLE = ToolHarvest.__table__
+JOB_TYPES = (ght.SHED_REPOSITORY, ght.SHED_TOOL_FOLDER)
+
+
+@dataclass(frozen=True)
+class Job:
+    id: int
+    url: str
+    artifact_type: str
+    attempts: int
+    # commit the repository was last harvested at
+    head_commit: str = None
+
+
+def new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def lease_expiry(config):
+    return func.now() + timedelta(seconds=config.lease_seconds)
+
+
+# Leases that expired on their last attempt are not claimable any more
+def expire_leases(session, config):
+    return session.execute(
+        update(HARVEST_TABLE)
+        .where(HARVEST_TABLE.c.status == STATUS_PROCESSING)
+        .where(HARVEST_TABLE.c.lease_expires_at < func.now())
+        .where(HARVEST_TABLE.c.attempts >= config.max_attempts)
+        .values(status=STATUS_ERROR, lease_owner=None, lease_expires_at=None)
+    ).rowcount
+
+
+def claim(session, owner, config, artifact_types=JOB_TYPES, limit=None):
+    """
+    Lease up to limit claimable rows to owner and commit. Rows locked by
+    other workers are skipped instead of waited for.
+    """
+    if limit is None:
+        limit = config.claim_batch
+    expired = expire_leases(session, config)
+    if expired:
+        logger.warning(f"{expired} expired leases ran out of attempts")
+    claimable = (
+        select(HARVEST_TABLE.c.id)
+        .where(HARVEST_TABLE.c.artifact_type.in_(artifact_types))
+        .where(HARVEST_TABLE.c.attempts < config.max_attempts)
+        .where(
+            or_(
+                HARVEST_TABLE.c.status == STATUS_PENDING,
+                and_(
+                    HARVEST_TABLE.c.status == STATUS_PROCESSING,
+                    HARVEST_TABLE.c.lease_expires_at < func.now(),
+                ),
+            )
+        )
+        .order_by(HARVEST_TABLE.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = session.execute(
+        update(HARVEST_TABLE)
+        .where(HARVEST_TABLE.c.id.in_(claimable.scalar_subquery()))
+        .values(
+            status=STATUS_PROCESSING,
+            lease_owner=owner,
+            lease_expires_at=lease_expiry(config),
+            heartbeat_at=func.now(),
+            attempts=HARVEST_TABLE.c.attempts + 1,
+        )
+        .returning(
+            HARVEST_TABLE.c.id,
+            HARVEST_TABLE.c.url,
+            HARVEST_TABLE.c.artifact_type,
+            HARVEST_TABLE.c.attempts,
+            HARVEST_TABLE.c.head_commit,
+        )
+    ).all()
+    session.commit()
+    return sorted((Job(*row) for row in rows), key=lambda job: job.id)
+
+
+def heartbeat(session, owner, job_ids, config):
+    """
+    Extend the leases owner still holds on job_ids and commit. Returns the
+    number of leases extended.
+    """
+    extended = session.execute(
+        update(HARVEST_TABLE)
+        .where(HARVEST_TABLE.c.id.in_(job_ids))
+        .where(HARVEST_TABLE.c.lease_owner == owner)
+        .where(HARVEST_TABLE.c.status == STATUS_PROCESSING)
+        .values(lease_expires_at=lease_expiry(config), heartbeat_at=func.now())
+    ).rowcount
+    session.commit()
+    return extended
+
+
+# complete and fail only touch rows still leased to owner and leave the
+# commit to the caller, so the job results and its status land together.
+# They return whether the lease was still held. values are extra columns to
+# set on the row.
+def complete(session, owner, job, status=STATUS_COMPLETED, **values):
+    return (
+        session.execute(
+            update(HARVEST_TABLE)
+            .where(HARVEST_TABLE.c.id == job.id)
+            .where(HARVEST_TABLE.c.lease_owner == owner)
+            .values(
+                status=status,
+                eror_code=None,
+                lease_owner=None,
+                lease_expires_at=None,
+                updated_at=func.now(),
+                **values,
+            )
+            .returning(HARVEST_TABLE.c.id)
+        ).first()
+        is not None
+    )
+
+
+def fail(session, owner, job, config, error_code=None):
+    return (
+        session.execute(
+            update(HARVEST_TABLE)
+            .where(HARVEST_TABLE.c.id == job.id)
+            .where(HARVEST_TABLE.c.lease_owner == owner)
+            .values(
+                status=case(
+                    (HARVEST_TABLE.c.attempts >= config.max_attempts, STATUS_ERROR),
+                    else_=STATUS_PENDING,
+                ),
+                eror_code=error_code,
+                lease_owner=None,
+                lease_expires_at=None,
+                updated_at=func.now(),
+            )
+            .returning(HARVEST_TABLE.c.id)
+        ).first()
+        is not None
+    )
+
+
+class Heartbeat:
+    """
+    Keeps the leases of the running jobs alive from a background thread.
+    """
+
+    def __init__(self, owner, job_ids, config):
+        self.owner = owner
+        self.job_ids = list(job_ids)
+        self.config = config
+        self.stop = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name="lease-heartbeat", daemon=True
+        )
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+    def _run(self):
+        with new_session() as session:
+            while not self.stop.wait(self.config.heartbeat_interval):
+                try:
+                    extended = heartbeat(session, self.owner, self.job_ids, self.config)
+                except Exception as e:
+                    logger.error(f"Heartbeat failed: {e}")
+                    session.rollback()
+                    continue
+                if extended < len(self.job_ids):
+                    logger.debug(
+                        f"Extended {extended} of {len(self.job_ids)} leases, "
+                        "the others finished or were lost"
+                    )
+
+
+# Network side of a job, runs before any database transaction is opened. A
+# repository job returns its head commit and folder url -> tree sha map, the
+# map is None when the head commit did not move since the last harvest.
+def fetch_job(job):
+    if job.artifact_type == ght.SHED_REPOSITORY:
+        branch, head_commit = galaxy_toolshed.get_repo_head(job.url)
+        if head_commit == job.head_commit:
+            return head_commit, None
+        folder_shas = galaxy_toolshed.get_tool_folder_shas(
+            job.url, branch, head_commit
+        )
+        return head_commit, folder_shas
+    if job.artifact_type == ght.SHED_TOOL_FOLDER:
+        return galaxy_toolshed.crawl_tool_folder(job.url)
+    raise ValueError(f"No handler for artifact type {job.artifact_type}")
+
+
+# Returns the extra columns to set when completing the job
+def store_job(job, results, session):
+    if job.artifact_type == ght.SHED_REPOSITORY:
+        head_commit, folder_shas = results
+        if folder_shas is None:
+            logger.info(f"{job.url} unchanged at {head_commit}")
+        else:
+            added, requeued = ght.sync_tool_folders(folder_shas, session)
+            logger.info(
+                f"Queued {added} new and {requeued} changed of "
+                f"{len(folder_shas)} tool folders of {job.url}"
+            )
+        return {"head_commit": head_commit}
+    # A tool without uri would be skipped by add_tools_to_db, fail the job
+    # instead of completing it with tools missing
+    missing = [tool.id or tool.tool_name for tool in results if not tool.uri]
+    if missing:
+        raise ValueError(f"No toolshed uri for tools {', '.join(map(str, missing))}")
+    stored = ght.add_tools_to_db(results, session)
+    logger.info(f"Stored {stored} tools from {job.url}")
+    return {}
+
+
+def requeue(session):
+    """
+    Start a re-harvest: every repository that is not being processed goes
+    back to pending, as do tool folders that ran out of attempts. Unchanged
+    repositories and folders are skipped by their jobs. Commits and returns
+    the number of rows requeued.
+    """
+    requeued = session.execute(
+        update(HARVEST_TABLE)
+        .where(HARVEST_TABLE.c.status != STATUS_PROCESSING)
+        .where(
+            or_(
+                HARVEST_TABLE.c.artifact_type == ght.SHED_REPOSITORY,
+                and_(
+                    HARVEST_TABLE.c.artifact_type == ght.SHED_TOOL_FOLDER,
+                    HARVEST_TABLE.c.status == STATUS_ERROR,
+                ),
+            )
+        )
+        .values(status=STATUS_PENDING, attempts=0, eror_code=None)
+    ).rowcount
+    session.commit()
+    return requeued
+
+
+# Hand a claimed job back untouched, without spending one of its attempts
+def release(session, owner, job):
+    session.execute(
+        update(HARVEST_TABLE)
+        .where(HARVEST_TABLE.c.id == job.id)
+        .where(HARVEST_TABLE.c.lease_owner == owner)
+        .values(
+            status=STATUS_PENDING,
+            attempts=HARVEST_TABLE.c.attempts - 1,
+            lease_owner=None,
+            lease_expires_at=None,
+        )
+    )
+
+
+def error_code(e):
+    response = getattr(e, "response", None)
+    status_code = getattr(response, "status_code", None)
+    return str(status_code) if status_code else type(e).__name__
+
+
+def run_job(job, owner, config):
+    with new_session() as session:
+        try:
+            results = fetch_job(job)
+            with pipeline(session):
+                values = store_job(job, results, session)
+                completed = complete(session, owner, job, **values)
+            if completed:
+                session.commit()
+                return True
+            # Another worker took over the expired lease, drop our results
+            logger.warning(f"Lost the lease on {job.url}, discarding results")
+            session.rollback()
+            return False
+        except Exception as e:
+            logger.error(f"Error processing {job.url} (attempt {job.attempts}): {e}")
+            session.rollback()
+            fail(session, owner, job, config, error_code(e))
+            session.commit()
+            return False
+
+
+def run_worker(owner=None, config=None, max_jobs=None, stop=None):
+    """
+    Claim and process jobs until the queue is empty (exit_when_idle), until
+    max_jobs were processed or until stop is set. Returns the number of jobs
+    completed.
+    """
+    if config is None:
+        config = load_queue_config()
+    if owner is None:
+        owner = new_worker_id()
+    if stop is None:
+        stop = threading.Event()
+    logger.info(f"Queue worker {owner} started")
+    processed = 0
+    completed = 0
+    while not stop.is_set() and (max_jobs is None or processed < max_jobs):
+        limit = config.claim_batch
+        if max_jobs is not None:
+            limit = min(limit, max_jobs - processed)
+        with new_session() as session:
+            jobs = claim(session, owner, config, limit=limit)
+        if not jobs:
+            if config.exit_when_idle:
+                break
+            stop.wait(config.poll_interval)
+            continue
+        with Heartbeat(owner, [job.id for job in jobs], config):
+            for index, job in enumerate(jobs):
+                if stop.is_set():
+                    with new_session() as session:
+                        for unprocessed in jobs[index:]:
+                            release(session, owner, unprocessed)
+                        session.commit()
+                    break
+                completed += run_job(job, owner, config)
+                processed += 1
+    logger.info(f"Queue worker {owner} stopped after {completed} completed jobs")
+    return completed
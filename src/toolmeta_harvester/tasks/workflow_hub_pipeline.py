@@ -0,0 +1,242 @@
+import logging
+import queue
+import threading
+from toolmeta_harvester.config import load_workflow_hub_config
+from toolmeta_harvester.adaptors import galaxy_workflow_hub as gwh
+from toolmeta_harvester.adaptors import galaxy_workflow as ga_workflow
+from toolmeta_harvester.tasks import galaxy_harvest_tasks as ght
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the items in a queue
+DONE = object()
+
+
+def put(q, item, stop):
+    # Give up on a full queue once the pipeline is stopped
+    while True:
+        try:
+            q.put(item, timeout=1)
+            return True
+        except queue.Full:
+            if stop.is_set():
+                return False
+
+
+def acquire(budget, stop):
+    # Wait for a free slot of the budget, give up once the pipeline is stopped
+    while not budget.acquire(timeout=1):
+        if stop.is_set():
+            return False
+    return True
+
+
+class Stage:
+    """
+    Pool of threads applying fn to the items of in_queue and putting the
+    results on out_queue. A failing item is logged, dropped and reported to
+    on_drop. After the last worker has seen DONE, out_sentinels DONE markers
+    are passed on. Once stop is set the remaining items are drained without
+    processing.
+    """
+
+    def __init__(
+        self, name, fn, in_queue, out_queue, workers, out_sentinels, stop, on_drop=None
+    ):
+        self.name = name
+        self.fn = fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.workers = workers
+        self.out_sentinels = out_sentinels
+        self.stop = stop
+        self.on_drop = on_drop
+        self._remaining = workers
+        self._lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(
+                target=self._run, name=f"{self.name}-{i}", daemon=True
+            )
+            t.start()
+            self.threads.append(t)
+
+    def _run(self):
+        while True:
+            item = self.in_queue.get()
+            if item is DONE:
+                break
+            if self.stop.is_set():
+                continue
+            try:
+                result = self.fn(item)
+            except Exception as e:
+                logger.error(f"{self.name} failed for {describe(item)}: {e}")
+                if self.on_drop:
+                    self.on_drop()
+                continue
+            if result is not None:
+                put(self.out_queue, result, self.stop)
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last:
+            for _ in range(self.out_sentinels):
+                self.out_queue.put(DONE)
+
+
+def describe(item):
+    if isinstance(item, tuple):
+        item = item[0]
+    if isinstance(item, dict):
+        return item.get("url", item.get("id", ""))
+    return getattr(item, "url", item)
+
+
+def download_workflow(wf):
+    return wf, gwh.get_ga_workflow(wf)
+
+
+def parse_workflow(item):
+    wf, ga_w = item
+    workflow_info = ga_workflow.parse_workflow(ga_w)
+    workflow_info.url = wf["url"]
+    workflow_info.description = wf.get("description", "")
+    return workflow_info
+
+
+# With a budget, every listed workflow takes a slot, so no more workflows are
+# in flight than are still to be written
+def produce_workflows(out_queue, out_sentinels, stop, type="galaxy", budget=None):
+    try:
+        for wf in gwh.get_hub_workflows(type=type):
+            if budget is not None and not acquire(budget, stop):
+                break
+            if stop.is_set() or not put(out_queue, wf, stop):
+                break
+    except Exception as e:
+        logger.error(f"Error listing WorkflowHub workflows: {e}")
+    finally:
+        for _ in range(out_sentinels):
+            out_queue.put(DONE)
+
+
+# Store a batch in the generic table, then the artifact rows of the workflows
+# it inserted in one bulk write. Existing workflows keep their artifacts.
+def write_batch(batch, session, on_written=None, update_existing=True):
+    inserted = []
+    try:
+        outcome = ght.upsert_workflows_to_generic_table(
+            batch, session, batch_size=len(batch), update=update_existing
+        )
+        inserted.extend(outcome["inserted"])
+        stored = batch
+    except Exception as e:
+        # Isolate the failing workflows, the rest of the batch is still written
+        logger.error(f"Error storing batch of {len(batch)} workflows: {e}")
+        stored = []
+        for workflow_info in batch:
+            try:
+                outcome = ght.upsert_workflows_to_generic_table(
+                    [workflow_info], session, update=update_existing
+                )
+            except Exception as e:
+                logger.error(f"Error storing workflow {workflow_info.url}: {e}")
+                continue
+            inserted.extend(outcome["inserted"])
+            stored.append(workflow_info)
+    inserted = set(inserted)
+    new_workflows = [wf for wf in stored if wf.url in inserted]
+    if new_workflows:
+        try:
+            ght.add_workflows_to_db(new_workflows, session)
+        except Exception as e:
+            session.rollback()
+            logger.error(
+                f"Error storing artifacts of {len(new_workflows)} workflows: {e}"
+            )
+    if on_written:
+        for workflow_info in stored:
+            on_written(workflow_info)
+    return len(stored)
+
+
+def harvest_workflow_hub(session, no_of_workflows=None, config=None, on_written=None):
+    """
+    Harvest WorkflowHub Galaxy workflows with overlapping stages:
+    listing -> downloaders -> parsers -> batched database writer.
+    Bounded queues between the stages provide backpressure. Stops after
+    no_of_workflows workflows are written, when given: only as many
+    workflows are listed as are still to be written, a dropped workflow
+    frees its slot for the next one. Returns the number of workflows written.
+    """
+    config = config or load_workflow_hub_config()
+    stop = threading.Event()
+    budget = threading.Semaphore(no_of_workflows) if no_of_workflows else None
+    on_drop = budget.release if budget is not None else None
+    listed = queue.Queue(maxsize=config.queue_size)
+    downloaded = queue.Queue(maxsize=config.queue_size)
+    parsed = queue.Queue(maxsize=config.queue_size)
+
+    producer = threading.Thread(
+        target=produce_workflows,
+        args=(listed, config.download_workers, stop, "galaxy", budget),
+        name="hub-listing",
+        daemon=True,
+    )
+    downloaders = Stage(
+        "download",
+        download_workflow,
+        listed,
+        downloaded,
+        config.download_workers,
+        config.parse_workers,
+        stop,
+        on_drop,
+    )
+    parsers = Stage(
+        "parse",
+        parse_workflow,
+        downloaded,
+        parsed,
+        config.parse_workers,
+        1,
+        stop,
+        on_drop,
+    )
+    producer.start()
+    downloaders.start()
+    parsers.start()
+
+    written = 0
+    batch = []
+    while True:
+        try:
+            item = parsed.get(timeout=1)
+        except queue.Empty:
+            item = None
+        if item is DONE:
+            break
+        if item is not None and not stop.is_set():
+            batch.append(item)
+        # Flush full batches, or partial ones while the parsers are busy
+        if batch and (len(batch) >= config.write_batch_size or item is None):
+            if no_of_workflows:
+                batch = batch[: no_of_workflows - written]
+            stored = write_batch(batch, session, on_written, config.update_existing)
+            written += stored
+            # Workflows that failed to store give their slots back
+            if on_drop:
+                for _ in range(len(batch) - stored):
+                    on_drop()
+            batch = []
+            if no_of_workflows and written >= no_of_workflows:
+                logger.info(f"Harvested {written} workflows, stopping pipeline")
+                stop.set()
+    if batch and not stop.is_set():
+        if no_of_workflows:
+            batch = batch[: no_of_workflows - written]
+        written += write_batch(batch, session, on_written, config.update_existing)
+    return written